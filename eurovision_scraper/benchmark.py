@@ -0,0 +1,303 @@
+'''
+    Parse-only benchmark of the spiders over a frozen corpus of contest articles.
+
+    The articles are read from the snapshot store (see snapshots.py), or from a directory of
+    html files named after the articles (e.g. Eurovision_Song_Contest_1957.html), and each
+    spider's parse method is called directly, without a reactor or any downloads. Wall time,
+    rows/sec and peak memory are reported per spider, per year and per table finder method.
+
+    e.g.
+        python -m eurovision_scraper.benchmark --save-baseline
+        python -m eurovision_scraper.benchmark --backend lxml
+
+    Every run is compared against the saved baseline (benchmark_baseline.json). Anything that
+    got slower than the threshold, or now yields a different number of rows, is reported as a
+    regression and the exit status is 1.
+'''
+import argparse
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from scrapy.http import HtmlResponse
+from scrapy.utils.project import data_path
+
+from eurovision_scraper.snapshots import SnapshotStore
+from eurovision_scraper.spiders.eurovision_vote_spider import EurovisionSpider as EurovisionVoteSpider
+from eurovision_scraper.spiders.eurovision_participant_spider import EurovisionSpider as EurovisionParticipantSpider
+from eurovision_scraper.spiders.eurovision_results import EurovisionResultsSpider
+
+ARTICLE_RE = re.compile(r'Eurovision_Song_Contest_(\d{4})(\.html?)?$')
+
+# the table finder methods that are timed for each spider
+TABLE_FINDERS = {
+    'eurovision_vote': ['parse_table_post_2015', 'parse_table_pre_2016', 'get_2013_results'],
+    'eurovision_participant': [],
+    'eurovision_results': ['table_after_voting_window', 'table_by_caption', 'table_by_final_caption',
+                           'table_after_legend_with_running_order', 'table_after_legend'],
+}
+
+# per year timings below this many seconds are too noisy to be flagged as regressions
+MIN_FLAGGED_SECONDS = 0.01
+
+
+def load_corpus(snapshot_dir=None, pages_dir=None):
+    '''
+        Returns a sorted list of (year, url, body) tuples, one per contest article
+    '''
+    corpus = {}
+
+    if pages_dir:
+        for name in os.listdir(pages_dir):
+            match = ARTICLE_RE.search(name)
+            if match:
+                with open(os.path.join(pages_dir, name), 'rb') as f:
+                    url = f'https://en.wikipedia.org/wiki/Eurovision_Song_Contest_{match.group(1)}'
+                    corpus[match.group(1)] = (match.group(1), url, f.read())
+    else:
+        store = SnapshotStore(snapshot_dir or data_path('snapshots'))
+        for url in store.index:
+            match = ARTICLE_RE.search(url)
+            if match:
+                body, _ = store.get(url)
+                corpus[match.group(1)] = (match.group(1), url, body)
+
+    return [corpus[year] for year in sorted(corpus)]
+
+
+def timed(method, timings):
+    '''
+        Wrap a spider method so that the time spent in it is added to timings. Generators
+        are timed while they are consumed
+    '''
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        timings['calls'] += 1
+
+        if hasattr(result, '__next__'):
+            timings['wall'] += time.perf_counter() - start
+            return timed_generator(result, timings)
+
+        timings['wall'] += time.perf_counter() - start
+        return result
+
+    return wrapper
+
+
+def timed_generator(generator, timings):
+    while True:
+        start = time.perf_counter()
+        try:
+            value = next(generator)
+        except StopIteration:
+            timings['wall'] += time.perf_counter() - start
+            return
+        timings['wall'] += time.perf_counter() - start
+        yield value
+
+
+def build_responses(corpus):
+    '''
+        Returns a fresh response per article along with the time spent parsing the html. The
+        html is parsed up front so that it isn't attributed to the first spider
+    '''
+    responses = []
+    start = time.perf_counter()
+
+    for year, url, body in corpus:
+        response = HtmlResponse(url=url, body=body, encoding='utf-8')
+        response.selector
+        responses.append((year, response))
+
+    return responses, time.perf_counter() - start
+
+
+def run_spider(spider, responses):
+    '''
+        Parse every response with the spider and return (rows, {year: (wall, rows)})
+    '''
+    years = {}
+    total_rows = 0
+
+    # only errors are logged while the spider runs, the warnings of the articles that miss a
+    # table would flood the report (and be timed along with the parsing)
+    logger = logging.getLogger(spider.name)
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+
+    try:
+        for year, response in responses:
+            start = time.perf_counter()
+            rows = sum(1 for _ in spider.parse(response) or [])
+
+            years[year] = (time.perf_counter() - start, rows)
+            total_rows += rows
+    finally:
+        logger.setLevel(level)
+
+    return total_rows, years
+
+
+def benchmark(corpus, repeat=3, backend=None):
+    report = {'articles': len(corpus), 'html': None, 'spiders': {}}
+    spider_classes = [EurovisionVoteSpider, EurovisionParticipantSpider, EurovisionResultsSpider]
+
+    for spider_class in spider_classes:
+        best = None
+
+        for _ in range(repeat):
+            spider = spider_class(backend=backend) if backend else spider_class()
+            methods = {name: {'calls': 0, 'wall': 0.0} for name in TABLE_FINDERS[spider.name]}
+
+            for name, timings in methods.items():
+                setattr(spider, name, timed(getattr(spider, name), timings))
+
+            responses, html_wall = build_responses(corpus)
+            report['html'] = html_wall if report['html'] is None else min(report['html'], html_wall)
+
+            start = time.perf_counter()
+            rows, years = run_spider(spider, responses)
+            wall = time.perf_counter() - start
+
+            if best is None or wall < best['wall']:
+                best = {'wall': wall, 'rows': rows, 'years': years, 'methods': methods}
+
+        # measure memory in a separate pass, tracemalloc slows down the parsing considerably
+        responses, _ = build_responses(corpus)
+        tracemalloc.start()
+        run_spider(spider_class(backend=backend) if backend else spider_class(), responses)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report['spiders'][spider_class.name] = {
+            'wall': best['wall'],
+            'rows': best['rows'],
+            'rows_per_sec': best['rows'] / best['wall'] if best['wall'] else 0,
+            'peak_memory': peak_memory,
+            'years': {year: {'wall': wall, 'rows': rows} for year, (wall, rows) in best['years'].items()},
+            'methods': best['methods'],
+        }
+
+    return report
+
+
+def find_regressions(report, baseline, threshold):
+    '''
+        Returns a description of everything that is slower than the baseline by more than the
+        threshold (e.g. 0.2 is 20%) or yields a different number of rows
+    '''
+    regressions = []
+
+    def compare(label, wall, base_wall, min_seconds=0):
+        if base_wall and wall > base_wall * (1 + threshold) and wall - base_wall > min_seconds:
+            regressions.append(f'{label}: {base_wall * 1000:.1f} ms -> {wall * 1000:.1f} ms')
+
+    for name, spider in report['spiders'].items():
+        base = baseline['spiders'].get(name)
+        if not base:
+            continue
+
+        compare(name, spider['wall'], base['wall'])
+
+        if spider['rows'] != base['rows']:
+            regressions.append(f'{name}: {base["rows"]} rows -> {spider["rows"]} rows')
+
+        for method, timings in spider['methods'].items():
+            base_method = base['methods'].get(method)
+            if base_method:
+                compare(f'{name}.{method}', timings['wall'], base_method['wall'], MIN_FLAGGED_SECONDS)
+
+        for year, timings in spider['years'].items():
+            base_year = base['years'].get(year)
+            if not base_year:
+                continue
+
+            compare(f'{name} {year}', timings['wall'], base_year['wall'], MIN_FLAGGED_SECONDS)
+
+            if timings['rows'] != base_year['rows']:
+                regressions.append(f'{name} {year}: {base_year["rows"]} rows -> {timings["rows"]} rows')
+
+    return regressions
+
+
+def print_report(report, verbose=False):
+    print(f'{report["articles"]} articles, html parsing {report["html"]:.3f}s')
+    print()
+    print(f'{"spider":28} {"wall (s)":>10} {"rows":>8} {"rows/sec":>10} {"peak mem (MB)":>14}')
+
+    for name, spider in report['spiders'].items():
+        print(f'{name:28} {spider["wall"]:10.3f} {spider["rows"]:8} {spider["rows_per_sec"]:10.0f} '
+              f'{spider["peak_memory"] / 1e6:14.1f}')
+
+    print()
+    print(f'{"table finder":60} {"calls":>6} {"wall (s)":>10}')
+
+    for name, spider in report['spiders'].items():
+        for method, timings in spider['methods'].items():
+            print(f'{name + "." + method:60} {timings["calls"]:6} {timings["wall"]:10.3f}')
+
+    if verbose:
+        print()
+        print(f'{"spider":28} {"year":>6} {"wall (ms)":>10} {"rows":>8}')
+
+        for name, spider in report['spiders'].items():
+            for year, timings in spider['years'].items():
+                print(f'{name:28} {year:>6} {timings["wall"] * 1000:10.1f} {timings["rows"]:8}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse-only benchmark of the eurovision spiders')
+    parser.add_argument('--snapshots', help='snapshot store directory (default: .scrapy/snapshots)')
+    parser.add_argument('--pages', help='directory of article html files, instead of the snapshot store')
+    parser.add_argument('--backend', choices=['selector', 'lxml'], help='vote spider parser backend')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per spider, the fastest is reported')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='save this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown flagged as a regression (0.2 is 20%%)')
+    parser.add_argument('--json', help='also write the full report to this file')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the timings of each year')
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.snapshots, args.pages)
+    if not corpus:
+        print('No contest articles found, run a crawl first to fill the snapshot store')
+        return 1
+
+    report = benchmark(corpus, repeat=args.repeat, backend=args.backend)
+    print_report(report, verbose=args.verbose)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f'\nSaved baseline to {args.baseline}')
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.threshold)
+
+        print()
+        if regressions:
+            print(f'{len(regressions)} regression(s) against {args.baseline}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+
+        print(f'No regressions against {args.baseline}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+# Project specific scrapy commands. These override the built in commands of the same name.
@@ -0,0 +1,36 @@
+from scrapy.commands.crawl import Command as CrawlCommand
+
+
+class Command(CrawlCommand):
+    '''
+        The built in crawl command with two extra options:
+
+        --replay        run the spider entirely from the snapshot store (see SnapshotMiddleware)
+                        without any network access
+        --incremental   only parse the articles that changed since the last crawl (see
+                        IncrementalSpiderMiddleware)
+    '''
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="serve every request from the snapshot store instead of the network",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="reuse the previous rows of articles that haven't changed since the last crawl",
+        )
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+
+        if opts.replay:
+            self.settings.set("SNAPSHOT_REPLAY", True, priority="cmdline")
+            # robots.txt is never fetched while replaying
+            self.settings.set("ROBOTSTXT_OBEY", False, priority="cmdline")
+
+        if opts.incremental:
+            self.settings.set("INCREMENTAL_ENABLED", True, priority="cmdline")
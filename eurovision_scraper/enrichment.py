@@ -0,0 +1,265 @@
+'''
+    Looks up the wiki pages of the artists and songs (the artistWikiUrl and songWikiUrl of the
+    participants) through the MediaWiki query api, many titles per request, and reads a few
+    fields from the infobox of each page (see EurovisionEnrichmentSpider)
+'''
+import json
+import os
+import re
+from urllib.parse import unquote, urlencode, urlsplit
+
+# the most titles the query api takes in a single request (for clients without the apihighlimits right)
+MAX_TITLES = 50
+
+# the infobox fields read for each metadata field, in order of preference
+INFOBOX_FIELDS = {
+    'birthYear': ('birth_date', 'born'),
+    'origin': ('origin', 'birth_place'),
+    'genre': ('genre', 'genres'),
+    'length': ('length',),
+}
+
+# templates whose parameters are the items of a list
+LIST_TEMPLATES = ('hlist', 'flatlist', 'plainlist', 'ubl', 'unbulleted list', 'flat list', 'plain list')
+
+COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+REF_RE = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE)
+BR_RE = re.compile(r'<br\s*/?>', re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]+>')
+LINK_RE = re.compile(r'\[\[(?:[^|\]]*\|)?([^\]]*)\]\]')
+EXTERNAL_LINK_RE = re.compile(r'\[https?://\S+\s*([^\]]*)\]')
+TEMPLATE_RE = re.compile(r'\{\{[^{}]*\}\}')
+YEAR_RE = re.compile(r'\b(1[89]\d\d|20\d\d)\b')
+DURATION_RE = re.compile(r'\b(\d{1,2}:\d\d)\b')
+
+
+def wiki_title(url):
+    '''
+        Returns the title of the article that a wiki url links to, None for links to pages
+        that don't exist (red links) or to a section of a contest article (e.g. a footnote)
+    '''
+    parts = urlsplit(url)
+
+    if '/wiki/' not in parts.path or parts.fragment:
+        return None
+
+    title = unquote(parts.path.split('/wiki/', 1)[1]).replace('_', ' ').strip()
+
+    if not title or title.startswith('Eurovision Song Contest '):
+        return None
+
+    return title
+
+
+def query_url(api_url, titles):
+    '''
+        The query api url for the wikitext of the lead section (section 0, which holds the
+        infobox) of up to MAX_TITLES pages, following redirects. The rest of each article isn't
+        downloaded
+    '''
+    return api_url + '?' + urlencode({
+        'action': 'query',
+        'titles': '|'.join(titles),
+        'prop': 'revisions',
+        'rvprop': 'content',
+        'rvslots': 'main',
+        'rvsection': 0,
+        'redirects': 1,
+        'format': 'json',
+        'formatversion': 2,
+    })
+
+
+def resolved_titles(query):
+    '''
+        Returns {requested title: title of the page} for the titles of a query api response
+        that were normalized or redirected
+    '''
+    moves = {}
+
+    for move in query.get('normalized', []) + query.get('redirects', []):
+        moves.setdefault(move['from'], move['to'])
+
+    resolved = {}
+    for title in moves:
+        target, seen = title, set()
+        # redirects may chain (a normalized title that is a redirect), stop at any loop
+        while target in moves and target not in seen:
+            seen.add(target)
+            target = moves[target]
+        resolved[title] = target
+
+    return resolved
+
+
+def split_top_level(text, separator='|'):
+    '''
+        Splits wikitext on the separator, except where it's inside a template or a link
+    '''
+    parts, depth, start, i = [], 0, 0, 0
+
+    while i < len(text):
+        pair = text[i:i + 2]
+        if pair in ('{{', '[['):
+            depth += 1
+            i += 2
+            continue
+        if pair in ('}}', ']]'):
+            depth = max(0, depth - 1)
+            i += 2
+            continue
+        if text[i] == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+
+    parts.append(text[start:])
+    return parts
+
+
+def infobox_fields(wikitext):
+    '''
+        Returns {name: value} of the parameters of the first infobox of a page, the values
+        still in wikitext
+    '''
+    start = wikitext.lower().find('{{infobox')
+    if start == -1:
+        return {}
+
+    # find the end of the infobox template, which holds other templates
+    depth, i = 0, start
+    while i < len(wikitext):
+        if wikitext.startswith('{{', i):
+            depth += 1
+            i += 2
+        elif wikitext.startswith('}}', i):
+            depth -= 1
+            i += 2
+            if depth == 0:
+                break
+        else:
+            i += 1
+
+    fields = {}
+    for part in split_top_level(COMMENT_RE.sub('', wikitext[start + 2:i - 2]))[1:]:
+        name, sep, value = part.partition('=')
+        if sep:
+            fields[name.strip().lower().replace(' ', '_')] = value.strip()
+
+    return fields
+
+
+def plain_text(value):
+    value = BR_RE.sub(' ', value)
+    value = LINK_RE.sub(r'\1', value)
+    value = EXTERNAL_LINK_RE.sub(r'\1', value)
+
+    # drop any templates that are left, innermost first
+    while TEMPLATE_RE.search(value):
+        value = TEMPLATE_RE.sub('', value)
+
+    value = TAG_RE.sub('', value).replace("'''", '').replace("''", '')
+    return ' '.join(value.split()).strip(' ,;')
+
+
+def list_items(value):
+    '''
+        The items of a wikitext list: a list template, bullet points, line breaks or commas
+    '''
+    value = REF_RE.sub('', value).strip()
+    match = re.match(r'\{\{\s*([^|}]+)', value)
+
+    if match and match.group(1).strip().lower() in LIST_TEMPLATES:
+        end = value.rfind('}}')
+        params = [p for p in split_top_level(value[2:end])[1:] if not re.match(r'^\s*\w+\s*=', p)]
+        value = '\n'.join(params)
+
+    items = []
+    for item in re.split(r'\n\s*\*|^\s*\*|\n|<br\s*/?>|,', value, flags=re.IGNORECASE):
+        item = plain_text(item.strip().lstrip('*'))
+        if item:
+            items.append(item)
+
+    return items
+
+
+def infobox_value(fields, field):
+    for name in INFOBOX_FIELDS[field]:
+        value = REF_RE.sub('', fields.get(name, '')).strip()
+        if value:
+            return value
+
+    return ''
+
+
+def page_metadata(page):
+    '''
+        Returns the metadata of a page of a query api response (formatversion=2)
+    '''
+    if page.get('missing') or page.get('invalid'):
+        return {'title': page.get('title', ''), 'pageId': None}
+
+    revision = page['revisions'][0]
+    wikitext = revision['slots']['main']['content'] if 'slots' in revision else revision.get('content', '')
+    fields = infobox_fields(wikitext)
+
+    birth = YEAR_RE.search(infobox_value(fields, 'birthYear'))
+
+    return {
+        'title': page['title'],
+        'pageId': page.get('pageid'),
+        'birthYear': int(birth.group(1)) if birth else None,
+        'origin': plain_text(infobox_value(fields, 'origin')),
+        'genre': '|'.join(list_items(infobox_value(fields, 'genre'))),
+        'length': song_length(infobox_value(fields, 'length')),
+    }
+
+
+def song_length(value):
+    '''
+        Returns a length as m:ss, from e.g. '3:05' or {{duration|m=3|s=5}}
+    '''
+    duration = re.search(r'm\s*=\s*(\d+)\s*\|\s*s\s*=\s*(\d+)', value)
+    if duration:
+        return f'{int(duration.group(1))}:{int(duration.group(2)):02d}'
+
+    match = DURATION_RE.search(value)
+    return match.group(1) if match else ''
+
+
+class EnrichmentCache:
+    '''
+        The metadata of every title that was looked up in an earlier crawl, so that later
+        crawls only query the titles they haven't seen before:
+
+        {"ABBA": {"title": "ABBA", "pageId": 2350, "birthYear": null, "origin": "Stockholm, Sweden", ...}}
+
+        Titles without a page are kept too (with a null pageId)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.titles = {}
+        self.dirty = False
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.titles = json.load(f)
+
+    def get(self, title):
+        return self.titles.get(title)
+
+    def put(self, title, metadata):
+        self.titles[title] = metadata
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.titles, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,92 @@
+import json
+import os
+
+from itemadapter import ItemAdapter
+from scrapy.utils.misc import load_object
+
+from eurovision_scraper.snapshots import page_revision
+
+
+class IncrementalState:
+    '''
+        The validators (ETag, Last-Modified and wiki revision id) and the scraped rows of every
+        contest article, as of the last crawl. This lets an incremental crawl send conditional
+        requests and reuse the previous rows of articles that haven't changed.
+
+        The state of each spider is kept in its own JSON file:
+
+        {
+            "https://en.wikipedia.org/wiki/Eurovision_Song_Contest_1957": {
+                "etag": "W/\"123/abc\"", "last_modified": "...", "revision": "123",
+                "items": [["eurovision_scraper.items.VoteItem", {"year": 1957, ...}], ...]
+            }
+        }
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.pages = json.load(f)
+
+    def validators(self, url):
+        '''
+            Returns the conditional request headers for the provided url, if it was crawled before
+        '''
+        page = self.pages.get(url)
+        headers = {}
+
+        if page:
+            if page.get('etag'):
+                headers['If-None-Match'] = page['etag']
+            if page.get('last_modified'):
+                headers['If-Modified-Since'] = page['last_modified']
+
+        return headers
+
+    def is_unchanged(self, response):
+        '''
+            True if the response is a 304, or a full response for the revision that was
+            already scraped (for servers that don't support conditional requests)
+        '''
+        page = self.pages.get(response.url)
+
+        if not page:
+            return False
+
+        if response.status == 304:
+            return True
+
+        revision = page_revision(response.body)
+        return revision is not None and revision == page.get('revision')
+
+    def update(self, response, items):
+        self.pages[response.url] = {
+            'etag': (response.headers.get('ETag') or b'').decode('latin-1'),
+            'last_modified': (response.headers.get('Last-Modified') or b'').decode('latin-1'),
+            'revision': page_revision(response.body),
+            'items': [[self.item_class_path(item), ItemAdapter(item).asdict()] for item in items],
+        }
+
+    def items(self, url):
+        '''
+            Rebuild the items that were scraped from the provided url by the last crawl
+        '''
+        for class_path, fields in self.pages.get(url, {}).get('items', []):
+            yield fields if class_path is None else load_object(class_path)(**fields)
+
+    @staticmethod
+    def item_class_path(item):
+        if isinstance(item, dict):
+            return None
+
+        return f'{type(item).__module__}.{type(item).__qualname__}'
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pages, f)
+        os.replace(tmp_path, self.path)
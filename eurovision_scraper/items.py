@@ -3,6 +3,9 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+from dataclasses import dataclass
+from typing import Optional
+
 import scrapy
 
 
@@ -10,3 +13,52 @@ class EurovisionScraperItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+# the rows are slotted, immutable dataclasses rather than scrapy.Item dicts: a full crawl
+# yields tens of thousands of votes, and these take a fraction of the memory of a dict each.
+# rows with the same key are dropped across the whole crawl (see pipelines.DedupPipeline)
+
+
+@dataclass(slots=True, frozen=True)
+class VoteItem:
+    year: int
+    round: str
+    country: str
+    votingCountry: str
+    voteType: str
+    points: int
+
+
+@dataclass(slots=True, frozen=True)
+class ParticipantItem:
+    year: int
+    country: str
+    broadcaster: str = ''
+    artist: str = ''
+    artistWikiUrl: str = ''
+    song: str = ''
+    songWikiUrl: str = ''
+    language: str = ''
+    songwriters: str = ''
+    conductors: str = ''
+
+
+@dataclass(slots=True, frozen=True)
+class ResultItem:
+    year: int
+    country: str
+    runningOrder: str
+    place: str
+
+
+@dataclass(slots=True, frozen=True)
+class EnrichmentItem:
+    url: str
+    kind: str
+    title: str = ''
+    pageId: Optional[int] = None
+    birthYear: Optional[int] = None
+    origin: str = ''
+    genre: str = ''
+    length: str = ''
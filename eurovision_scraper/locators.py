@@ -0,0 +1,73 @@
+import json
+import os
+
+
+class LocatorCache:
+    '''
+        The locator that found each table of each contest year in the last crawl of a spider,
+        so that later crawls try that locator first and only search through the others when
+        it no longer finds the table. A locator is whatever the spider uses to look a table up,
+        e.g. the name of a table finder method or a table header:
+
+        {
+            "1957": {"results": "table_by_caption"},
+            "2010": {"f/t": "Detailed voting results of the final", "sf1/t": "..."}
+        }
+
+        A table that is now found by a different locator, or not found at all, shows where the
+        layout of the articles drifted (see ContestSpider.locator_found)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.years = {}
+        self.dirty = False
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.years = json.load(f)
+
+    def get(self, year, table):
+        return self.years.get(str(year), {}).get(table)
+
+    def order(self, year, table, locators, generic=()):
+        '''
+            Returns the locators with the one that found the table last time first. The generic
+            locators are fallbacks that may also find other tables of the article (e.g. a header
+            that the headers of the semi-final tables start with as well), those are never moved
+            ahead of the more specific locators: they're only tried once the others missed
+        '''
+        cached = self.get(year, table)
+
+        if cached not in locators or cached in generic:
+            return list(locators)
+
+        return [cached] + [locator for locator in locators if locator != cached]
+
+    def found(self, year, table, locator):
+        '''
+            Record the locator that found a table (None if no locator did)
+        '''
+        year = str(year)
+        previous = self.get(year, table)
+
+        if previous == locator:
+            return
+
+        if locator is None:
+            self.years[year].pop(table)
+        else:
+            self.years.setdefault(year, {})[table] = locator
+
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.years, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,197 @@
+'''
+    Merges the output files of several crawls (e.g. shards crawled with -a years=...) into a
+    single file, sorted by year, round and country.
+
+    e.g.
+        scrapy crawl eurovision_vote -a years=1956-1989 -O shards/votes_1.csv
+        scrapy crawl eurovision_vote -a years=1990- -O shards/votes_2.csv
+        python -m eurovision_scraper.merge -o eurovision_vote_data.csv shards/votes_*.csv
+
+    The inputs don't need to be sorted: they are read in chunks of --chunk-size rows, which
+    are sorted and written to temporary files, and those are then merged with a k-way merge.
+    Memory use therefore doesn't grow with the size or number of the inputs. Rows are ordered
+    by every column in turn (year, round, country, ...), so the output is the same byte for
+    byte whatever order the inputs are given in. Rows that appear more than once (e.g. in
+    overlapping shards) are written once.
+
+    Inputs and output are csv files, or JSON lines files (.jl, .jsonl), all with the same fields.
+'''
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import os
+import sys
+import tempfile
+
+# the rounds in the order they're held, any other round sorts after these
+ROUND_ORDER = {round: i for i, round in enumerate(['f', 'sf', 'sf1', 'sf2', 'sf3'])}
+
+JSON_LINES_EXTENSIONS = ('.jl', '.jsonl')
+
+# the fields that the items hold as numbers, written as such to JSON lines output
+JSON_INTEGER_FIELDS = ('year', 'points')
+
+
+def is_json_lines(path):
+    return path.endswith(JSON_LINES_EXTENSIONS)
+
+
+def read_rows(path):
+    '''
+        Yields the fields of an input file, then each of its rows as a list of strings in
+        field order
+    '''
+    with open(path, newline='', encoding='utf-8') as f:
+        if is_json_lines(path):
+            items = (json.loads(line) for line in f if line.strip())
+            first = next(items, None)
+            fields = list(first) if first else []
+            yield fields
+
+            for item in itertools.chain([first] if first else [], items):
+                yield ['' if item.get(field) is None else str(item[field]) for field in fields]
+            return
+
+        reader = csv.reader(f)
+        fields = next(reader, None) or []
+        yield fields
+
+        for row in reader:
+            # a feed that several crawls appended to repeats its header
+            if row and row != fields:
+                yield row
+
+
+def read_fields(path):
+    rows = read_rows(path)
+    fields = next(rows)
+    rows.close()
+    return fields
+
+
+def sort_key(fields):
+    '''
+        Returns the key function that orders rows by year, round and country, and then by every
+        other column, so that the order of the rows doesn't depend on the order of the inputs
+    '''
+    first = [name for name in ('year', 'round', 'country') if name in fields]
+    order = [fields.index(name) for name in first] + [i for i, name in enumerate(fields) if name not in first]
+
+    def key(row):
+        values = []
+        for i in order:
+            value = row[i]
+            if fields[i] == 'year':
+                values.append((0, int(value)) if value.isdigit() else (1, value))
+            elif fields[i] == 'round':
+                values.append((ROUND_ORDER.get(value, len(ROUND_ORDER)), value))
+            else:
+                values.append(value)
+        return values
+
+    return key
+
+
+def json_item(fields, row):
+    return {
+        field: int(value) if field in JSON_INTEGER_FIELDS and value.isdigit() else value
+        for field, value in zip(fields, row)
+    }
+
+
+def write_run(rows, directory):
+    '''
+        Writes sorted rows to a temporary file and returns its path
+    '''
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=directory)
+    with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, lineterminator='\n').writerows(rows)
+    return path
+
+
+def read_run(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.reader(f)
+
+
+def sorted_runs(paths, fields, key, chunk_size, directory):
+    '''
+        Splits the inputs into sorted runs of at most chunk_size rows, and returns their paths
+    '''
+    runs = []
+
+    for path in paths:
+        rows = read_rows(path)
+        input_fields = next(rows)
+
+        if not input_fields:
+            continue
+
+        if input_fields != fields:
+            raise SystemExit(f'{path} has the fields {input_fields}, expected {fields}')
+
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            chunk.sort(key=key)
+            runs.append(write_run(chunk, directory))
+
+    return runs
+
+
+def merge(paths, output, chunk_size=100000):
+    '''
+        Merges the input files into the output file, returns the number of rows written
+    '''
+    fields = next((fields for fields in map(read_fields, paths) if fields), None)
+
+    if fields is None:
+        raise SystemExit('None of the inputs has any rows')
+
+    key = sort_key(fields)
+    count = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = sorted_runs(paths, fields, key, chunk_size, directory)
+        merged = heapq.merge(*(read_run(run) for run in runs), key=key)
+
+        tmp_path = output + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            if is_json_lines(output):
+                write = lambda row: f.write(json.dumps(json_item(fields, row), ensure_ascii=False) + '\n')
+            else:
+                # the line endings of the csv feed exporter, so that a merge of shards is the same
+                # file as a single crawl (sorted)
+                writer = csv.writer(f, lineterminator='\r\n')
+                writer.writerow(fields)
+                write = writer.writerow
+
+            previous = None
+            for row in merged:
+                # duplicates are next to each other once the rows are sorted
+                if row != previous:
+                    write(row)
+                    count += 1
+                previous = row
+
+        os.replace(tmp_path, output)
+
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge the output files of several crawls into a single sorted file')
+    parser.add_argument('inputs', nargs='+', help='csv or JSON lines files to merge')
+    parser.add_argument('-o', '--output', required=True, help='the merged file (may be one of the inputs)')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='rows sorted in memory at a time')
+    options = parser.parse_args(argv)
+
+    count = merge(options.inputs, options.output, options.chunk_size)
+    print(f'{count} rows from {len(options.inputs)} files written to {options.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
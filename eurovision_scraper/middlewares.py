@@ -3,11 +3,26 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
+from twisted.internet.task import deferLater
+from weakref import WeakKeyDictionary, WeakValueDictionary
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from eurovision_scraper.incremental import IncrementalState
+from eurovision_scraper.parse_stats import ParseStats
+from eurovision_scraper.snapshots import SnapshotStore
+from eurovision_scraper.throttle import ThrottleState, TokenBucket, retry_after
+
 
 class EurovisionScraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +116,395 @@ class EurovisionScraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+# crawls running in the same process (see run.py) share the store of each snapshot directory,
+# so that none of them overwrites the index with an outdated copy when it closes
+_snapshot_stores = WeakValueDictionary()
+
+
+def snapshot_store(settings):
+    path = data_path(settings["SNAPSHOT_DIR"], createdir=True)
+
+    if path not in _snapshot_stores:
+        store = SnapshotStore(
+            path,
+            max_revisions=settings.getint("SNAPSHOT_MAX_REVISIONS"),
+            max_bytes=settings.getint("SNAPSHOT_MAX_BYTES") or None,
+        )
+        _snapshot_stores[path] = store
+        return store
+
+    return _snapshot_stores[path]
+
+
+class SnapshotMiddleware:
+    # Saves every fetched page to the SnapshotStore. When SNAPSHOT_REPLAY is set, every
+    # request is answered from the store instead, so no request ever reaches the network.
+    # Requests for pages that were never stored are dropped in replay mode.
+
+    # response headers kept alongside each snapshot
+    stored_headers = ("Content-Type", "ETag", "Last-Modified")
+
+    def __init__(self, store, stats, enabled=True, replay=False):
+        self.store = store
+        self.stats = stats
+        self.enabled = enabled
+        self.replay = replay
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        enabled = settings.getbool("SNAPSHOT_ENABLED")
+        replay = settings.getbool("SNAPSHOT_REPLAY")
+
+        if not enabled and not replay:
+            raise NotConfigured
+
+        s = cls(snapshot_store(settings), crawler.stats, enabled=enabled, replay=replay)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_request(self, request, spider):
+        if not self.replay:
+            return None
+
+        snapshot = self.store.get(request.url)
+
+        if snapshot is None:
+            self.stats.inc_value("snapshot/missing")
+            spider.logger.warning(f"No snapshot stored for {request.url}")
+            raise IgnoreRequest(f"No snapshot stored for {request.url}")
+
+        body, entry = snapshot
+        headers = Headers(entry["headers"])
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+
+        self.stats.inc_value("snapshot/replayed")
+        return respcls(
+            url=request.url,
+            status=200,
+            headers=headers,
+            body=body,
+            flags=["snapshot"],
+            request=request,
+        )
+
+    def process_response(self, request, response, spider):
+        if not self.enabled or "snapshot" in response.flags or response.status != 200:
+            return response
+
+        headers = {
+            name: response.headers.get(name).decode("latin-1")
+            for name in self.stored_headers
+            if response.headers.get(name)
+        }
+
+        # store redirected pages under the originally requested url(s) too, so that they
+        # can be found again in replay mode
+        for url in [response.url] + request.meta.get("redirect_urls", []):
+            self.store.put(url, response.body, headers)
+
+        self.stats.inc_value("snapshot/stored")
+        return response
+
+    def spider_opened(self, spider):
+        mode = "Replaying from" if self.replay else "Storing snapshots in"
+        spider.logger.info("%s %s" % (mode, self.store.path))
+
+    def spider_closed(self, spider):
+        if self.enabled:
+            evicted = self.store.evict()
+            self.stats.set_value("snapshot/evicted", evicted)
+
+        self.store.save()
+
+
+# the incremental downloader and spider middlewares share the state of each running crawl
+_incremental_states = WeakKeyDictionary()
+
+
+def incremental_state(crawler):
+    if crawler not in _incremental_states:
+        path = os.path.join(
+            data_path(crawler.settings["INCREMENTAL_DIR"], createdir=True),
+            f"{crawler.spidercls.name}.json",
+        )
+        _incremental_states[crawler] = IncrementalState(path)
+
+    return _incremental_states[crawler]
+
+
+class IncrementalDownloaderMiddleware:
+    # Turns requests for articles that were crawled before into conditional requests, using
+    # the ETag and Last-Modified values recorded by the last crawl. A 304 response is passed
+    # on to the spider, where IncrementalSpiderMiddleware replaces it with the previous rows.
+
+    def __init__(self, state):
+        self.state = state
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_ENABLED"):
+            raise NotConfigured
+
+        return cls(incremental_state(crawler))
+
+    def process_request(self, request, spider):
+        validators = self.state.validators(request.url)
+
+        if validators:
+            for name, value in validators.items():
+                request.headers.setdefault(name, value)
+
+            request.meta["handle_httpstatus_list"] = request.meta.get("handle_httpstatus_list", []) + [304]
+
+        return None
+
+
+class IncrementalSpiderMiddleware:
+    # Reuses the rows of the last crawl for articles that haven't changed since (a 304, or the
+    # same wiki revision id) without parsing them, and records the validators and rows of
+    # every article that is parsed. The state is saved when the spider closes.
+
+    def __init__(self, state, stats):
+        self.state = state
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_ENABLED"):
+            raise NotConfigured
+
+        s = cls(incremental_state(crawler), crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_spider_output(self, response, result, spider):
+        if self.state.is_unchanged(response):
+            self.stats.inc_value("incremental/unchanged")
+            yield from self.state.items(response.url)
+            return
+
+        items = []
+        for i in result:
+            if is_item(i):
+                items.append(i)
+            yield i
+
+        self.record(response, items)
+
+    async def process_spider_output_async(self, response, result, spider):
+        if self.state.is_unchanged(response):
+            self.stats.inc_value("incremental/unchanged")
+            for i in self.state.items(response.url):
+                yield i
+            return
+
+        items = []
+        async for i in result:
+            if is_item(i):
+                items.append(i)
+            yield i
+
+        self.record(response, items)
+
+    def record(self, response, items):
+        # only record the page once all of its rows were parsed without errors
+        if response.status == 200:
+            self.state.update(response, items)
+            self.stats.inc_value("incremental/parsed")
+
+    def spider_closed(self, spider):
+        self.state.save()
+
+
+class ParseStatsMiddleware:
+    # Instruments every response that is parsed: the time spent in the spider callback, the
+    # number of xpath evaluations, the rows emitted and the table locators that matched (see
+    # parse_stats.py). The figures go into the crawler stats (parse/...) and a JSON report
+    # with the details of each article is written to PARSE_STATS_DIR when the spider closes.
+    # This should run next to the spider, so that the callback time doesn't include any
+    # other middleware.
+
+    def __init__(self, parse_stats):
+        self.parse_stats = parse_stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("PARSE_STATS_ENABLED"):
+            raise NotConfigured
+
+        path = os.path.join(
+            data_path(crawler.settings["PARSE_STATS_DIR"], createdir=True),
+            f"{crawler.spidercls.name}.json",
+        )
+        s = cls(ParseStats(crawler.stats, path))
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_spider_input(self, response, spider):
+        self.parse_stats.start(response)
+        return None
+
+    def process_spider_output(self, response, result, spider):
+        probe = self.parse_stats.probe(response)
+
+        try:
+            for i in probe.timed(result):
+                if is_item(i):
+                    probe.count(i, spider)
+                yield i
+        finally:
+            self.parse_stats.finish(probe)
+
+    async def process_spider_output_async(self, response, result, spider):
+        probe = self.parse_stats.probe(response)
+
+        try:
+            async for i in probe.timed_async(result):
+                if is_item(i):
+                    probe.count(i, spider)
+                yield i
+        finally:
+            self.parse_stats.finish(probe)
+
+    def spider_closed(self, spider):
+        self.parse_stats.save()
+        spider.logger.info("Parse stats report saved to %s" % self.parse_stats.path)
+
+
+# with THROTTLE_SHARED, the throttling state shared by every crawl of the process
+_shared_throttle_state = None
+
+
+def shared_throttle_state():
+    global _shared_throttle_state
+
+    if _shared_throttle_state is None:
+        _shared_throttle_state = ThrottleState()
+
+    return _shared_throttle_state
+
+
+class AdaptiveThrottleMiddleware:
+    # Paces the requests to each host with a TokenBucket (see throttle.py) instead of a fixed
+    # DOWNLOAD_DELAY. The rate of each host starts at THROTTLE_START_RATE requests per second
+    # and follows the latency of its responses, within THROTTLE_MIN_RATE and THROTTLE_MAX_RATE.
+    #
+    # A 429 or 503 response cuts the rate of the host, pauses it for the Retry-After of the
+    # response (or an exponential backoff if there is none) and the request is retried up to
+    # THROTTLE_MAX_RETRIES times. THROTTLE_BUDGET caps the number of requests sent by a crawl,
+    # any request beyond it is dropped. Requests with the dont_throttle meta key are sent
+    # straight away.
+
+    throttle_statuses = (429, 503)
+
+    def __init__(self, settings, stats, state=None):
+        self.stats = stats
+        self.state = state or ThrottleState()
+
+        self.start_rate = settings.getfloat("THROTTLE_START_RATE")
+        self.min_rate = settings.getfloat("THROTTLE_MIN_RATE")
+        self.max_rate = settings.getfloat("THROTTLE_MAX_RATE")
+        self.burst = settings.getint("THROTTLE_BURST")
+        self.target_concurrency = settings.getfloat("THROTTLE_TARGET_CONCURRENCY")
+        self.backoff = settings.getfloat("THROTTLE_BACKOFF")
+        self.max_retries = settings.getint("THROTTLE_MAX_RETRIES")
+        self.max_retry_after = settings.getfloat("THROTTLE_MAX_RETRY_AFTER")
+        self.budget = settings.getint("THROTTLE_BUDGET")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("THROTTLE_ENABLED"):
+            raise NotConfigured
+
+        state = shared_throttle_state() if crawler.settings.getbool("THROTTLE_SHARED") else None
+        s = cls(crawler.settings, crawler.stats, state)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def bucket(self, request):
+        host = urlparse_cached(request).hostname or ""
+
+        if host not in self.state.buckets:
+            self.state.buckets[host] = TokenBucket(
+                self.start_rate,
+                burst=self.burst,
+                min_rate=self.min_rate,
+                max_rate=self.max_rate,
+                target_concurrency=self.target_concurrency,
+                backoff=self.backoff,
+            )
+
+        return self.state.buckets[host]
+
+    async def process_request(self, request, spider):
+        if request.meta.get("dont_throttle"):
+            return None
+
+        if self.budget and self.state.sent >= self.budget:
+            if not self.stats.get_value("throttle/budget_exceeded"):
+                spider.logger.warning(f"Request budget of {self.budget} requests used up, dropping the remaining requests")
+
+            self.stats.inc_value("throttle/budget_exceeded")
+            raise IgnoreRequest(f"Request budget of {self.budget} requests used up")
+
+        # counted before waiting, so that the requests waiting for a token can't overrun the budget
+        self.state.sent += 1
+        self.stats.inc_value("throttle/requests")
+
+        bucket = self.bucket(request)
+        delay = bucket.reserve()
+
+        while delay > 0:
+            self.stats.inc_value("throttle/delay_time", delay)
+            await self.sleep(delay)
+
+            # the host may have been paused by a throttling response in the meantime
+            delay = bucket.pause_remaining()
+
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get("dont_throttle"):
+            return response
+
+        bucket = self.bucket(request)
+
+        if response.status in self.throttle_statuses:
+            retries = request.meta.get("throttle_retries", 0)
+            delay = retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = 2 ** retries
+
+            bucket.throttled()
+            bucket.pause(min(delay, self.max_retry_after))
+            self.stats.inc_value(f"throttle/response_status_count/{response.status}")
+
+            if retries >= self.max_retries:
+                self.stats.inc_value("throttle/gave_up")
+                spider.logger.warning(f"Gave up on {request.url} after {retries} throttled retries")
+                return response
+
+            self.stats.inc_value("throttle/retried")
+            retry = request.replace(dont_filter=True)
+            retry.meta["throttle_retries"] = retries + 1
+            return retry
+
+        # responses served by the snapshot store have no download latency
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            bucket.observe(latency, ok=response.status < 400)
+
+        return response
+
+    async def sleep(self, seconds):
+        from twisted.internet import reactor
+
+        await maybe_deferred_to_future(deferLater(reactor, seconds))
+
+    def spider_closed(self, spider):
+        for host, bucket in self.state.buckets.items():
+            self.stats.set_value(f"throttle/rate/{host}", round(bucket.rate, 3))
@@ -0,0 +1,430 @@
+'''
+    A local stand-in for the wiki, for trying out the crawl settings (throttling, incremental
+    crawls) without sending any requests to Wikipedia. The articles are served from the
+    snapshot store (see snapshots.py) or a directory of html files named after the articles,
+    and the server can be told to throttle its clients the way a busy server would.
+
+    e.g.
+        python -m eurovision_scraper.mockserver --port 8000 --max-rate 2 --retry-after 1
+        scrapy crawl eurovision_all -s WIKI_BASE_URL=http://127.0.0.1:8000/wiki/ -s ROBOTSTXT_OBEY=False
+
+    --max-rate R        answer with --status (429 by default) when more than R requests per
+                        second arrive
+    --throttle-every N  answer every Nth request with --status, regardless of the request rate
+    --retry-after S     the Retry-After header sent with throttling responses (omitted if not set)
+    --latency S         wait S seconds before answering each request
+    --revisions DIR,... serve a sequence of revisions of the articles, one directory of html
+                        files per revision (instead of --pages). Each article moves on to its
+                        next revision every --advance-after requests for it (1 by default) and
+                        stays at its last revision from then on. An article that's missing from
+                        a revision is answered with a 404 until it shows up
+
+    /robots.txt disallows /w/ for every user agent, as Wikipedia's does. Every article is sent
+    with an ETag, and conditional requests for an unchanged article are answered with a 304.
+    The number of requests served and throttled is printed on exit.
+
+    The parse api is mocked too, at /w/api.php: action=parse with prop=sections returns the
+    table of contents of an article and action=parse with section=N the html of a single
+    section, numbered the way MediaWiki numbers them (-s WIKI_API_URL=http://127.0.0.1:8000/w/api.php)
+
+    --wikitext DIR      answer action=query&prop=revisions requests (up to 50 titles each) with
+                        the wikitext of the pages in DIR, one file per page named after its
+                        title (e.g. ABBA.wiki). A page whose text is #REDIRECT [[Other]] is
+                        followed to Other when the request has redirects=1, and rvsection=0
+                        returns only the text before the first heading
+    --max-query-bytes N leave out the content of the pages of a query response beyond N bytes
+                        of wikitext, with a continue token for the rest
+'''
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import re
+import signal
+import threading
+import time
+import zlib
+from collections import Counter
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import lxml.html
+from lxml import etree
+from scrapy.utils.project import data_path
+
+from eurovision_scraper.snapshots import SnapshotStore, page_revision
+from eurovision_scraper.throttle import TokenBucket
+
+ARTICLE_PATH_RE = re.compile(r'^/wiki/([^/?#]+)')
+API_PATH = '/w/api.php'
+REDIRECT_RE = re.compile(r'^\s*#REDIRECT\s*\[\[([^\]|#]+)', re.IGNORECASE)
+WIKITEXT_HEADING_RE = re.compile(r'^==.*==\s*$', re.MULTILINE)
+
+# like Wikipedia's, the api and the other /w/ scripts are off limits for crawlers
+ROBOTS_TXT = 'User-agent: *\nDisallow: /w/\n'
+
+# the most titles a query may ask for, as for a MediaWiki client without the apihighlimits right
+MAX_QUERY_TITLES = 50
+
+
+def heading_level(element):
+    '''
+        Returns the level of a section heading (h2 to h6, either bare or wrapped in a
+        mw-heading div) or None if the element isn't a heading
+    '''
+    if not isinstance(element.tag, str):
+        return None
+
+    if element.tag == 'div' and 'mw-heading' in (element.get('class') or ''):
+        element = next((el for el in element.iter('h2', 'h3', 'h4', 'h5', 'h6')), element)
+
+    if element.tag in ('h2', 'h3', 'h4', 'h5', 'h6'):
+        return int(element.tag[1])
+
+    return None
+
+
+def article_sections(body):
+    '''
+        Splits an article into its sections, numbered the way the parse api numbers them.
+        Returns a (sections, fragments) tuple: the 'sections' list of a parse api response and
+        the html of each section, including its subsections (fragments[0] is the lead)
+    '''
+    root = lxml.html.fromstring(body)
+    containers = root.find_class('mw-parser-output')
+    container = containers[0] if containers else root.find('body')
+
+    sections = []
+    blocks = [[]]
+    counters = []
+
+    for child in container:
+        level = heading_level(child)
+
+        if level:
+            toclevel = level - 1
+            counters = counters[:toclevel] + [0] * (toclevel - len(counters))
+            counters[toclevel - 1] += 1
+            sections.append({
+                'toclevel': toclevel,
+                'level': str(level),
+                'line': child.text_content().strip(),
+                'number': '.'.join(str(c) for c in counters),
+                'index': str(len(sections) + 1),
+                'anchor': child.text_content().strip().replace(' ', '_'),
+            })
+            blocks.append([])
+
+        blocks[-1].append(etree.tostring(child, encoding='unicode', method='html'))
+
+    fragments = [''.join(blocks[0])]
+
+    for i, section in enumerate(sections):
+        # a section runs until the next heading of the same or a higher level
+        end = next((j for j in range(i + 1, len(sections)) if int(sections[j]['level']) <= int(section['level'])), len(sections))
+        fragments.append(''.join(''.join(block) for block in blocks[i + 1:end + 1]))
+
+    return sections, fragments
+
+
+class Articles:
+    '''
+        The html of each article by title, read from a snapshot store or a directory of pages
+    '''
+
+    def __init__(self, snapshot_dir=None, pages_dir=None):
+        self.snapshot_dir = snapshot_dir
+        self.pages_dir = pages_dir
+        self.store = None if pages_dir else SnapshotStore(snapshot_dir or data_path('snapshots'))
+
+    def get(self, title):
+        if self.pages_dir:
+            for name in (title + '.html', title):
+                path = os.path.join(self.pages_dir, os.path.basename(name))
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        return f.read()
+            return None
+
+        for url in self.store.index:
+            if url.rsplit('/', 1)[-1] == title:
+                snapshot = self.store.get(url)
+                return snapshot[0] if snapshot else None
+
+        return None
+
+
+class ArticleRevisions:
+    '''
+        A sequence of revisions of the articles, one directory of pages per revision (see
+        --revisions)
+    '''
+
+    def __init__(self, pages_dirs, advance_after=1):
+        self.revisions = [Articles(pages_dir=pages_dir) for pages_dir in pages_dirs]
+        self.advance_after = max(1, advance_after)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def get(self, title):
+        with self.lock:
+            served = self.requests[title]
+            self.requests[title] += 1
+
+        revision = min(served // self.advance_after, len(self.revisions) - 1)
+        return self.revisions[revision].get(title)
+
+
+class MockWikiHandler(http.server.BaseHTTPRequestHandler):
+    # set by serve()
+    articles = None
+    options = None
+    limiter = None
+    counts = None
+    lock = None
+
+    def do_GET(self):
+        with self.lock:
+            self.counts['requests'] += 1
+            throttled = self.throttled()
+            if throttled:
+                self.counts['throttled'] += 1
+
+        if self.options.latency:
+            time.sleep(self.options.latency)
+
+        if throttled:
+            self.send_response(self.options.status)
+            if self.options.retry_after is not None:
+                self.send_header('Retry-After', str(self.options.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if urlsplit(self.path).path == '/robots.txt':
+            self.send_text(ROBOTS_TXT)
+            return
+
+        if urlsplit(self.path).path == API_PATH:
+            self.send_api_response()
+            return
+
+        match = ARTICLE_PATH_RE.match(self.path)
+        body = self.articles.get(unquote(match.group(1))) if match else None
+
+        if body is None:
+            self.counts['not_found'] += 1
+            self.send_error(404)
+            return
+
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+        if self.headers.get('If-None-Match') == etag:
+            self.counts['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.counts['served'] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_api_response(self):
+        params = {name: values[0] for name, values in parse_qs(urlsplit(self.path).query).items()}
+
+        if params.get('action') == 'query':
+            self.send_json(self.query_response(params))
+            return
+
+        title = params.get('page', '').replace(' ', '_')
+        body = self.articles.get(title) if params.get('action') == 'parse' else None
+
+        if body is None:
+            data = {'error': {'code': 'missingtitle', 'info': "The page you specified doesn't exist."}}
+        else:
+            sections, fragments = article_sections(body)
+            data = {'parse': {'title': title.replace('_', ' '), 'revid': int(page_revision(body) or 0)}}
+
+            if 'section' in params:
+                index = int(params['section']) if params['section'].isdigit() else -1
+                if 0 <= index < len(fragments):
+                    data['parse']['text'] = '<div class="mw-parser-output">%s</div>' % fragments[index]
+                else:
+                    data = {'error': {'code': 'nosuchsection', 'info': f"There is no section {params['section']}."}}
+            else:
+                data['parse']['sections'] = sections
+
+        self.send_json(data)
+
+    def query_response(self, params):
+        '''
+            The response of the query api (formatversion=2) with the wikitext of each title
+        '''
+        titles = [title for title in params.get('titles', '').split('|') if title]
+
+        if len(titles) > MAX_QUERY_TITLES:
+            return {'error': {'code': 'toomanyvalues', 'info': f'Too many values supplied for parameter "titles". The limit is {MAX_QUERY_TITLES}.'}}
+
+        query = {'normalized': [], 'redirects': [], 'pages': []}
+        added = set()
+
+        # like the real api, a response that would get too big leaves out the content of the
+        # remaining pages and says where to continue from (here, the index of the title)
+        start = int(params.get('rvcontinue', 0) or 0)
+        sent, continue_from = 0, None
+
+        for i, requested in enumerate(titles):
+            title = requested.replace('_', ' ').strip()
+            title = title[:1].upper() + title[1:]
+            if title != requested:
+                query['normalized'].append({'fromencoded': False, 'from': requested, 'to': title})
+
+            text = self.wikitext(title)
+            redirect = REDIRECT_RE.match(text or '')
+            if redirect and params.get('redirects'):
+                target = redirect.group(1).strip()
+                query['redirects'].append({'from': title, 'to': target})
+                title, text = target, self.wikitext(target)
+
+            if title in added:
+                continue
+            added.add(title)
+
+            if text is None:
+                query['pages'].append({'ns': 0, 'title': title, 'missing': True})
+                continue
+
+            page = {'pageid': zlib.crc32(title.encode('utf-8')) % 10 ** 8, 'ns': 0, 'title': title}
+            query['pages'].append(page)
+
+            if params.get('rvsection') == '0':
+                heading = WIKITEXT_HEADING_RE.search(text)
+                text = text[:heading.start()] if heading else text
+            size = len(text.encode('utf-8'))
+
+            if i < start or continue_from is not None:
+                continue
+
+            if self.options.max_query_bytes and sent and sent + size > self.options.max_query_bytes:
+                continue_from = i
+                continue
+
+            sent += size
+            page['revisions'] = [{'slots': {'main': {'contentmodel': 'wikitext', 'contentformat': 'text/x-wiki', 'content': text}}}]
+
+        self.counts['queries'] += 1
+        self.counts['query_titles'] += len(titles)
+        self.counts['query_bytes'] += sent
+        data = {'query': {name: value for name, value in query.items() if value}}
+
+        if continue_from is None:
+            data['batchcomplete'] = True
+        else:
+            data['continue'] = {'rvcontinue': str(continue_from), 'continue': '||'}
+
+        return data
+
+    def wikitext(self, title):
+        if not self.options.wikitext:
+            return None
+
+        path = os.path.join(self.options.wikitext, quote(title.replace(' ', '_'), safe='') + '.wiki')
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def send_text(self, text):
+        payload = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.counts['api'] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def throttled(self):
+        if self.options.throttle_every and self.counts['requests'] % self.options.throttle_every == 0:
+            return True
+
+        # a request is throttled when the server's own bucket has no token left for it. the
+        # token isn't taken in that case, a throttled request doesn't use up the rate
+        if self.limiter is not None and self.limiter.reserve() > 0:
+            self.limiter.tokens += 1
+            return True
+
+        return False
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+
+def serve(options):
+    limiter = None
+    if options.max_rate:
+        limiter = TokenBucket(options.max_rate, burst=max(1, int(options.max_rate)))
+
+    if options.revisions:
+        articles = ArticleRevisions(options.revisions.split(','), options.advance_after)
+    else:
+        articles = Articles(options.snapshots, options.pages)
+
+    handler = type('MockWikiHandler', (MockWikiHandler,), {
+        'articles': articles,
+        'options': options,
+        'limiter': limiter,
+        'counts': Counter(),
+        'lock': threading.Lock(),
+    })
+
+    server = http.server.ThreadingHTTPServer((options.host, options.port), handler)
+
+    # print the counts when stopped with kill too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f'Serving the contest articles on http://{options.host}:{options.port}/wiki/')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(', '.join(f'{name}: {count}' for name, count in sorted(handler.counts.items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the contest articles locally, optionally throttled')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--snapshots', help='snapshot store directory (default: .scrapy/snapshots)')
+    parser.add_argument('--pages', help='directory of article html files, instead of the snapshot store')
+    parser.add_argument('--revisions', help='comma separated directories of article html files, one per revision')
+    parser.add_argument('--advance-after', type=int, default=1, help='requests for an article before its next revision is served')
+    parser.add_argument('--wikitext', help='directory of page wikitext files for the query api')
+    parser.add_argument('--max-query-bytes', type=int, help='wikitext bytes per query response before it is continued')
+    parser.add_argument('--max-rate', type=float, help='requests per second before throttling')
+    parser.add_argument('--throttle-every', type=int, help='throttle every Nth request')
+    parser.add_argument('--status', type=int, default=429, choices=[429, 503], help='status of throttling responses')
+    parser.add_argument('--retry-after', type=int, help='Retry-After of throttling responses, in seconds')
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before each response')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every request')
+    serve(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
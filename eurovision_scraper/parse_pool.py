@@ -0,0 +1,60 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.http import HtmlResponse
+from scrapy.utils.misc import load_object
+
+from eurovision_scraper.parse_stats import start_probe
+
+# the extractor spiders of each worker process, built on first use and reused for every article
+_extractors = {}
+
+
+def parse_pool(processes):
+    '''
+        Returns a pool of worker processes for extract(). The workers are spawned rather than
+        forked, as forking the reactor and its threads isn't safe
+    '''
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def extractor(class_path, kwargs):
+    key = (class_path, tuple(sorted(kwargs.items())))
+
+    if key not in _extractors:
+        _extractors[key] = load_object(class_path)(**kwargs)
+
+    return _extractors[key]
+
+
+def extract(url, body, encoding, extractors, instrument=False):
+    '''
+        Runs in a worker process. Parses the article with each of the extractor spiders,
+        given as (class path, spider kwargs) pairs, and returns a (rows, errors, stats) tuple:
+
+        rows    (extractor index, item) pairs, in the order the extractors produced them
+        errors  (extractor index, message) pairs for every extractor that failed, the
+                caller fails the article if there are any
+        stats   the figures of the parse probe (see ParseProbe.summary) if instrument is set
+    '''
+    response = HtmlResponse(url=url, body=body, encoding=encoding)
+    probe = start_probe(response) if instrument else None
+    rows = []
+    errors = []
+
+    start = time.perf_counter()
+
+    for i, (class_path, kwargs) in enumerate(extractors):
+        try:
+            spider = extractor(class_path, kwargs)
+            rows.extend((i, item) for item in spider.parse(response) or [])
+
+        except Exception as e:
+            errors.append((i, str(e)))
+
+    if probe is None:
+        return rows, errors, None
+
+    probe.parse_time = time.perf_counter() - start
+    return rows, errors, probe.summary()
@@ -0,0 +1,255 @@
+import json
+import os
+import time
+import weakref
+from collections import Counter
+
+from itemadapter import ItemAdapter
+from scrapy.selector import Selector
+
+# the probe of every response that is being parsed while ParseStatsMiddleware is enabled
+_probes = weakref.WeakKeyDictionary()
+
+# the counting selector of every instrumented response (see selector_for)
+_selectors = weakref.WeakKeyDictionary()
+
+
+class CountingSelector(Selector):
+    '''
+        Selector that counts its xpath evaluations (css queries are translated to xpath, so
+        they are counted too). The selectors it returns are of the same class, so every query
+        made from the response selector down to single cells is added to the same probe
+    '''
+    probe = None
+
+    def xpath(self, query, namespaces=None, **kwargs):
+        self.probe.xpath_evaluations += 1
+        return super().xpath(query, namespaces=namespaces, **kwargs)
+
+
+class ParseProbe:
+    '''
+        What happened while a single response was parsed: the time spent in the spider
+        callback, the number of xpath evaluations, the rows emitted (per round and vote type
+        for voting rows) and every table lookup the spiders recorded with record_table
+    '''
+
+    def __init__(self, response):
+        self.url = response.url
+        self.year = response.url.split('_')[-1]
+        self.parse_time = 0.0
+        self.xpath_evaluations = 0
+        self.rows = Counter()
+        self.tables = []
+
+        # set once the response was parsed in a worker process (see parse_pool.py)
+        self.offloaded = False
+
+        self.instrument(response)
+
+    def instrument(self, response):
+        # a selector class of its own, so that the evaluations of each response are counted
+        # separately. The spiders query the response through it (see selector_for)
+        selector_class = type('CountingSelector', (CountingSelector,), {'probe': self})
+        _selectors[response] = selector_class(response=response)
+
+    def count(self, item, spider):
+        adapter = ItemAdapter(item)
+
+        if 'round' in adapter and 'voteType' in adapter:
+            self.rows[f"{adapter['round']}/{adapter['voteType']}"] += 1
+        else:
+            self.rows[spider.name if isinstance(item, dict) else type(item).__name__] += 1
+
+    def timed(self, result):
+        '''
+            Iterate over the callback output, adding the time spent producing each value to
+            the parse time
+        '''
+        iterator = iter(result)
+
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                self.parse_time += time.perf_counter() - start
+                return
+            self.parse_time += time.perf_counter() - start
+            yield value
+
+    async def timed_async(self, result):
+        iterator = result.__aiter__()
+
+        while True:
+            start = time.perf_counter()
+            try:
+                value = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.add_time(time.perf_counter() - start)
+                return
+            self.add_time(time.perf_counter() - start)
+            yield value
+
+    def add_time(self, elapsed):
+        # the time spent waiting for a worker process isn't parse time, the worker's own
+        # parse time is added by merge instead
+        if not self.offloaded:
+            self.parse_time += elapsed
+
+    def summary(self):
+        return {
+            'parse_time': self.parse_time,
+            'xpath_evaluations': self.xpath_evaluations,
+            'tables': self.tables,
+        }
+
+    def merge(self, summary):
+        '''
+            Add the figures of the probe of a worker process that parsed the same response
+        '''
+        self.offloaded = True
+        self.parse_time += summary['parse_time']
+        self.xpath_evaluations += summary['xpath_evaluations']
+        self.tables.extend(summary['tables'])
+
+    def asdict(self):
+        return {
+            'url': self.url,
+            'year': self.year,
+            'parse_time': round(self.parse_time, 6),
+            'xpath_evaluations': self.xpath_evaluations,
+            'rows': dict(sorted(self.rows.items())),
+            'tables': self.tables,
+        }
+
+
+def start_probe(response):
+    probe = _probes[response] = ParseProbe(response)
+    return probe
+
+
+def probe_for(response):
+    '''
+        Returns the probe of the provided response, or None if it isn't instrumented
+    '''
+    return _probes.get(response)
+
+
+def selector_for(response):
+    '''
+        Returns the selector to query the response with: the counting selector of its probe if
+        the response is instrumented, response.selector otherwise
+    '''
+    selector = _selectors.get(response)
+    return response.selector if selector is None else selector
+
+
+def attach_probe(response, target):
+    '''
+        Add the parsing of the target response to the probe of the provided response, for a
+        page that is built by the spider itself (e.g. from the sections of an article)
+    '''
+    probe = probe_for(response)
+
+    if probe is not None:
+        _probes[target] = probe
+        probe.url = target.url
+        probe.year = target.url.split('_')[-1]
+        probe.instrument(target)
+
+
+def record_table(response, spider, table, locator, rows):
+    '''
+        Record a table lookup of a spider: the name of the table (e.g. 'results' or 'f/t'),
+        the locator that found it (None if no table was found) and the number of rows read
+        from it. This does nothing unless the response is instrumented by ParseStatsMiddleware
+    '''
+    probe = probe_for(response)
+
+    if probe is not None:
+        probe.tables.append({'spider': spider.name, 'table': table, 'locator': locator, 'rows': rows})
+
+
+class ParseStats:
+    '''
+        Collects the probes of a crawl into the crawler stats and a JSON report:
+
+        parse/responses, parse/time, parse/max_time     responses parsed and the callback time
+        parse/xpath_evaluations                         selector queries made by the spiders
+        parse/rows/<round>/<voteType>                   voting rows per round and vote type
+        parse/rows/<spider or item class>               every other row
+        parse/locator/<locator>                         which table locator matched, and how often
+        parse/tables/missing, parse/tables/empty        lookups that found no table, or a table
+                                                        without any rows
+        parse/empty_pages                               responses that produced no rows at all
+
+        The report lists the same figures for every response, sorted by year, along with the
+        slowest pages and every empty page and table
+    '''
+
+    def __init__(self, stats, path):
+        self.stats = stats
+        self.path = path
+        self.pages = []
+
+    def start(self, response):
+        return start_probe(response)
+
+    def probe(self, response):
+        return probe_for(response)
+
+    def finish(self, probe):
+        # responses that only lead to other requests (e.g. the table of contents of an
+        # article in the sections fetch mode) didn't parse any tables
+        if not probe.rows and not probe.tables:
+            return
+
+        self.pages.append(probe)
+
+        self.stats.inc_value('parse/responses')
+        self.stats.inc_value('parse/time', probe.parse_time)
+        self.stats.max_value('parse/max_time', probe.parse_time)
+        self.stats.inc_value('parse/xpath_evaluations', probe.xpath_evaluations)
+
+        for key, rows in probe.rows.items():
+            self.stats.inc_value(f'parse/rows/{key}', rows)
+
+        for table in probe.tables:
+            if table['locator'] is None:
+                self.stats.inc_value('parse/tables/missing')
+                continue
+
+            self.stats.inc_value(f"parse/locator/{table['locator']}")
+            if not table['rows']:
+                self.stats.inc_value('parse/tables/empty')
+
+        if not probe.rows:
+            self.stats.inc_value('parse/empty_pages')
+
+    def report(self):
+        pages = sorted((probe.asdict() for probe in self.pages), key=lambda page: (page['year'], page['url']))
+
+        return {
+            'responses': len(pages),
+            'parse_time': round(sum(page['parse_time'] for page in pages), 6),
+            'xpath_evaluations': sum(page['xpath_evaluations'] for page in pages),
+            'slowest': [
+                {'year': page['year'], 'parse_time': page['parse_time']}
+                for page in sorted(pages, key=lambda page: page['parse_time'], reverse=True)[:10]
+            ],
+            'empty_pages': [page['year'] for page in pages if not page['rows']],
+            'empty_tables': [
+                dict(table, year=page['year'])
+                for page in pages for table in page['tables']
+                if table['locator'] is not None and not table['rows']
+            ],
+            'pages': pages,
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=1)
+        os.replace(tmp_path, self.path)
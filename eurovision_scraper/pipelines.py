@@ -3,11 +3,535 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+from array import array
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.project import data_path
+
+from eurovision_scraper.exporters import to_int
+from eurovision_scraper.merge import is_json_lines, json_item, read_rows
+from eurovision_scraper.spiders.country_data import country_index
 
 
 class EurovisionScraperPipeline:
-    def process_item(self, item, spider):
+    def process_item(self, item):
+        return item
+
+
+# the fields that hold a country, in any kind of row
+COUNTRY_FIELDS = ('country', 'votingCountry')
+
+
+class CountryPipeline(EurovisionScraperPipeline):
+    '''
+        Replaces the country names of every row (votes, participants and results alike) with
+        their codes, through the precomputed CountryIndex. The spiders pass on the text of the
+        table cells as it is, so that every row is normalised once and in the same way. This
+        runs before the other pipelines, which see the codes only.
+
+        Names without a code are passed on unchanged, counted in the countries/unknown stat
+        and logged once each
+    '''
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.unknown = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_item(self, item):
+        item, unknown = normalise_countries(item)
+
+        for name in unknown:
+            self.stats.inc_value('countries/unknown')
+            if name not in self.unknown:
+                self.unknown.add(name)
+                self.crawler.spider.logger.warning(f'No country code for {name!r}')
+
+        return item
+
+
+def normalise_countries(item):
+    '''
+        Returns the item with the codes of its countries, along with the names that have no code
+    '''
+    adapter = ItemAdapter(item)
+    codes = {}
+    unknown = []
+
+    for field in COUNTRY_FIELDS:
+        value = adapter.get(field) if field in adapter else None
+        if not value:
+            continue
+
+        code = country_index.normalise(value)
+        if code is None:
+            unknown.append(value)
+        elif code != value:
+            codes[field] = code
+
+    if codes:
+        # the rows are frozen dataclasses, which are copied rather than changed
+        if dataclasses.is_dataclass(item):
+            item = dataclasses.replace(item, **codes)
+        else:
+            adapter.update(codes)
+
+    return item, unknown
+
+
+# the fields that identify a row, by the kind of row (told apart by a field only that kind
+# has). the results key includes the running order, as each country had two entries in 1956
+DEDUP_KEYS = [
+    ('vote', 'votingCountry', ('year', 'round', 'country', 'votingCountry', 'voteType')),
+    ('result', 'runningOrder', ('year', 'country', 'runningOrder')),
+    ('participant', 'broadcaster', ('year', 'country')),
+]
+
+
+class DedupPipeline(EurovisionScraperPipeline):
+    '''
+        Drops every row whose key (see DEDUP_KEYS) was already seen, across all the pages of
+        a crawl. Only an 8 byte hash of each key is kept, rather than the row itself.
+
+        With DEDUP_PERSIST the hashes are saved to .scrapy/dedup/<spider>.keys when the crawl
+        closes and loaded by the next crawl, so that crawls which append to the same feed
+        never write a row twice. Leave it off for feeds that are overwritten, or the second
+        crawl would write no rows at all
+    '''
+
+    def __init__(self, stats, path=None):
+        self.stats = stats
+        self.path = path
+        self.keys = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('DEDUP_ENABLED', True):
+            raise NotConfigured
+
+        path = None
+        if crawler.settings.getbool('DEDUP_PERSIST'):
+            path = os.path.join(data_path(crawler.settings.get('DEDUP_DIR', 'dedup'), createdir=True),
+                                f'{crawler.spidercls.name}.keys')
+
+        return cls(crawler.stats, path)
+
+    def open_spider(self):
+        if self.path and os.path.exists(self.path):
+            keys = array('Q')
+            with open(self.path, 'rb') as f:
+                keys.frombytes(f.read())
+            self.keys = set(keys)
+            self.stats.set_value('dedup/loaded_keys', len(self.keys))
+
+    def close_spider(self):
+        self.stats.set_value('dedup/keys', len(self.keys))
+
+        if self.path:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                array('Q', sorted(self.keys)).tofile(f)
+            os.replace(tmp_path, self.path)
+
+    def process_item(self, item):
+        key = row_key(ItemAdapter(item))
+
+        if key is None:
+            return item
+
+        if key in self.keys:
+            self.stats.inc_value('dedup/dropped')
+            raise DropItem(f'Duplicate row {item!r}', log_level='DEBUG')
+
+        self.keys.add(key)
+        return item
+
+
+def row_key(adapter):
+    '''
+        Returns the 64 bit hash of a row's key, or None if the item isn't a known kind of row
+    '''
+    for kind, marker, fields in DEDUP_KEYS:
+        if marker in adapter:
+            # values are compared as text, so that rows read back from older state files
+            # (where the year is a string) match the rows of a new crawl
+            key = '\x1f'.join([kind] + [str(adapter.get(field, '')) for field in fields])
+            return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    return None
+
+
+# the tables of the SQLite store. countries are kept in their own table and referenced by id
+# from the other tables. the vote, participant and result views join the country names back in
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS country (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS vote_row (
+    year INTEGER NOT NULL,
+    round TEXT,
+    country_id INTEGER REFERENCES country (id),
+    voting_country_id INTEGER REFERENCES country (id),
+    vote_type TEXT,
+    points INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS participant_row (
+    year INTEGER NOT NULL,
+    country_id INTEGER REFERENCES country (id),
+    broadcaster TEXT,
+    artist TEXT,
+    artist_wiki_url TEXT,
+    song TEXT,
+    song_wiki_url TEXT,
+    language TEXT,
+    songwriters TEXT,
+    conductors TEXT
+);
+
+CREATE TABLE IF NOT EXISTS result_row (
+    year INTEGER NOT NULL,
+    country_id INTEGER REFERENCES country (id),
+    running_order INTEGER,
+    place INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS vote_year_round ON vote_row (year, round);
+CREATE INDEX IF NOT EXISTS vote_country ON vote_row (country_id);
+CREATE INDEX IF NOT EXISTS vote_voting_country ON vote_row (voting_country_id);
+CREATE INDEX IF NOT EXISTS participant_year ON participant_row (year);
+CREATE INDEX IF NOT EXISTS participant_country ON participant_row (country_id);
+CREATE INDEX IF NOT EXISTS result_year ON result_row (year);
+CREATE INDEX IF NOT EXISTS result_country ON result_row (country_id);
+
+CREATE VIEW IF NOT EXISTS vote AS
+    SELECT v.year, v.round, c.name AS country, vc.name AS votingCountry, v.vote_type AS voteType, v.points
+    FROM vote_row v LEFT JOIN country c ON c.id = v.country_id LEFT JOIN country vc ON vc.id = v.voting_country_id;
+
+CREATE VIEW IF NOT EXISTS participant AS
+    SELECT p.year, c.name AS country, p.broadcaster, p.artist, p.artist_wiki_url AS artistWikiUrl, p.song,
+           p.song_wiki_url AS songWikiUrl, p.language, p.songwriters, p.conductors
+    FROM participant_row p LEFT JOIN country c ON c.id = p.country_id;
+
+CREATE VIEW IF NOT EXISTS result AS
+    SELECT r.year, c.name AS country, r.running_order AS runningOrder, r.place
+    FROM result_row r LEFT JOIN country c ON c.id = r.country_id;
+'''
+
+# (table, the item field that identifies the kind of row, the columns with the item field of
+# each). country fields are stored as country ids
+SQLITE_TABLES = [
+    ('vote_row', 'votingCountry', [
+        ('year', 'year'), ('round', 'round'), ('country_id', 'country'),
+        ('voting_country_id', 'votingCountry'), ('vote_type', 'voteType'), ('points', 'points'),
+    ]),
+    ('result_row', 'runningOrder', [
+        ('year', 'year'), ('country_id', 'country'), ('running_order', 'runningOrder'), ('place', 'place'),
+    ]),
+    ('participant_row', 'broadcaster', [
+        ('year', 'year'), ('country_id', 'country'), ('broadcaster', 'broadcaster'), ('artist', 'artist'),
+        ('artist_wiki_url', 'artistWikiUrl'), ('song', 'song'), ('song_wiki_url', 'songWikiUrl'),
+        ('language', 'language'), ('songwriters', 'songwriters'), ('conductors', 'conductors'),
+    ]),
+]
+
+
+class SqlitePipeline(EurovisionScraperPipeline):
+    '''
+        Stores the vote, participant and result rows in a SQLite database (the SQLITE_DATABASE
+        setting, e.g. -s SQLITE_DATABASE=eurovision.db), next to the csv feeds.
+
+        The rows of a year replace the rows that are already stored for that year: the first
+        row of a year (and kind of row) in a crawl deletes the year's previous rows, so a crawl
+        of a few years updates the store in place and leaves every other year as it was.
+
+        Rows are buffered and written SQLITE_BATCH_SIZE at a time, each batch in a single
+        transaction. Items are passed on unchanged
+    '''
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = None
+        self.countries = {}
+        # the rows waiting to be written, and the (table, year) pairs that were seen in this
+        # crawl, whose previous rows are deleted with the next batch
+        self.pending = {table: [] for table, _, _ in SQLITE_TABLES}
+        self.pending_years = []
+        self.replaced_years = set()
+        self.buffered = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('SQLITE_DATABASE')
+        if not path:
+            # a bare NotConfigured, as Scrapy logs a warning for one with a message
+            raise NotConfigured
+
+        return cls(path, crawler.settings.getint('SQLITE_BATCH_SIZE', 1000))
+
+    def open_spider(self):
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SQLITE_SCHEMA)
+        self.countries = dict(self.connection.execute('SELECT name, id FROM country'))
+
+    def close_spider(self):
+        self.flush()
+        self.connection.close()
+
+    def process_item(self, item):
+        adapter = ItemAdapter(item)
+        table = next((table for table, key, _ in SQLITE_TABLES if key in adapter), None)
+
+        if table is None:
+            return item
+
+        year = to_int(adapter.get('year'))
+
+        if (table, year) not in self.replaced_years:
+            self.replaced_years.add((table, year))
+            self.pending_years.append((table, year))
+
+        self.pending[table].append(adapter)
+        self.buffered += 1
+
+        if self.buffered >= self.batch_size:
+            self.flush()
+
         return item
+
+    def flush(self):
+        if not self.buffered and not self.pending_years:
+            return
+
+        try:
+            with self.connection:
+                for table, year in self.pending_years:
+                    self.connection.execute(f'DELETE FROM {table} WHERE year = ?', (year,))
+
+                for table, _, columns in SQLITE_TABLES:
+                    rows = [self.row(columns, adapter) for adapter in self.pending[table]]
+                    if rows:
+                        self.connection.executemany(
+                            f"INSERT INTO {table} ({', '.join(c for c, _ in columns)}) "
+                            f"VALUES ({', '.join('?' for _ in columns)})",
+                            rows
+                        )
+        except sqlite3.Error:
+            # the batch was rolled back, including any countries it added
+            self.countries = dict(self.connection.execute('SELECT name, id FROM country'))
+            raise
+
+        self.pending = {table: [] for table, _, _ in SQLITE_TABLES}
+        self.pending_years = []
+        self.buffered = 0
+
+    def row(self, columns, adapter):
+        values = []
+
+        for column, field in columns:
+            value = adapter.get(field)
+            if column.endswith('country_id'):
+                value = self.country_id(value)
+            elif column in ('year', 'points', 'running_order', 'place'):
+                value = to_int(value, default=value)
+            values.append(value)
+
+        return values
+
+    def country_id(self, name):
+        if not name:
+            return None
+
+        if name not in self.countries:
+            cursor = self.connection.execute('INSERT INTO country (name) VALUES (?)', (name,))
+            self.countries[name] = cursor.lastrowid
+
+        return self.countries[name]
+
+
+class Changelog:
+    '''
+        The changes of a feed file since its previous version: the rows that were inserted,
+        updated or deleted, by year. The previous version is read into an index of the hash of
+        each row by the hash of its key (see row_key) before the crawl overwrites the file.
+        Besides the hashes only the key fields of each previous row are kept, which is all that
+        a deleted row is written with
+    '''
+
+    def __init__(self, path, item_classes=None):
+        self.path = path
+        self.item_classes = tuple(item_classes or ())
+        self.fields = []
+        self.previous = {}
+        self.seen = set()
+        self.years = set()
+        self.changes = {}
+        self.unchanged = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        rows = read_rows(self.path)
+        self.fields = next(rows)
+
+        for values in rows:
+            row = dict(zip(self.fields, values))
+            key = row_key(row)
+            if key is not None:
+                # the year is the first key field of every kind of row
+                key_fields = next(fields for _, marker, fields in DEDUP_KEYS if marker in row)
+                self.previous[key] = (self.digest(row), [row.get(field, '') for field in key_fields], key_fields)
+
+    def accepts(self, item):
+        return not self.item_classes or isinstance(item, self.item_classes)
+
+    def add(self, adapter):
+        key = row_key(adapter)
+
+        if key is None or key in self.seen:
+            return
+
+        self.seen.add(key)
+        self.years.add(str(adapter.get('year')))
+        previous = self.previous.get(key)
+
+        if previous is None:
+            change = 'inserted'
+        elif previous[0] != self.digest(adapter):
+            change = 'updated'
+        else:
+            self.unchanged += 1
+            return
+
+        self.year_changes(adapter.get('year'))[change].append(adapter.asdict())
+
+    def digest(self, row):
+        # the values are hashed as text, the way they're read back from the file
+        text = '\x1f'.join('' if row.get(field) is None else str(row.get(field)) for field in self.fields)
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+    def year_changes(self, year):
+        return self.changes.setdefault(str(year), {'inserted': [], 'updated': [], 'deleted': []})
+
+    def write(self):
+        '''
+            Writes the changes next to the feed file (e.g. eurovision_vote_data.changelog.jl),
+            one JSON line per year with any changes. Rows are only deleted from the years that
+            were crawled, so a crawl of a few years (or an article that failed to download)
+            doesn't delete the rows of every other year
+        '''
+        for key, (_, values, key_fields) in self.previous.items():
+            if key not in self.seen and values[0] in self.years:
+                self.year_changes(values[0])['deleted'].append(json_item(key_fields, values))
+
+        years = sorted(self.changes, key=lambda year: (0, int(year)) if year.isdigit() else (1, year))
+        path = changelog_path(self.path)
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for year in years:
+                line = {'year': int(year) if year.isdigit() else year, **self.changes[year]}
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+        os.replace(tmp_path, path)
+
+    def counts(self):
+        return {
+            change: sum(len(changes[change]) for changes in self.changes.values())
+            for change in ('inserted', 'updated', 'deleted')
+        }
+
+
+class ChangelogPipeline(EurovisionScraperPipeline):
+    '''
+        Writes a changelog next to each local csv or JSON lines feed of the crawl, with the
+        rows that were inserted, updated and deleted since the previous crawl, so that the
+        users of a feed can apply those instead of reloading the whole file, e.g.
+        eurovision_vote_data.changelog.jl next to eurovision_vote_data.csv:
+
+        {"year": 2023, "inserted": [{...}], "updated": [{...}], "deleted": [{"year": 2023, "round": "f", ...}]}
+
+        Inserted and updated rows are written in full, deleted rows as their key fields (see
+        DEDUP_KEYS). Items are passed on unchanged
+    '''
+
+    def __init__(self, stats, changelogs):
+        self.stats = stats
+        self.changelogs = changelogs
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('CHANGELOG_ENABLED'):
+            raise NotConfigured
+
+        return cls(crawler.stats, [Changelog(path, classes) for path, classes in feed_files(crawler.settings)])
+
+    def open_spider(self):
+        # the pipelines are opened before the feeds, which may overwrite the previous output
+        for changelog in self.changelogs:
+            changelog.load()
+
+    def close_spider(self):
+        for changelog in self.changelogs:
+            changelog.write()
+
+            self.stats.inc_value('changelog/unchanged', changelog.unchanged)
+            for change, count in changelog.counts().items():
+                self.stats.inc_value(f'changelog/{change}', count)
+
+    def process_item(self, item):
+        adapter = ItemAdapter(item)
+
+        for changelog in self.changelogs:
+            if changelog.accepts(item):
+                changelog.add(adapter)
+
+        return item
+
+
+def feed_files(settings):
+    '''
+        Returns (path, item classes) of each feed of the crawl that is written to a local csv
+        or JSON lines file
+    '''
+    feeds = {}
+
+    if settings.get('FEED_URI'):
+        feeds[str(settings['FEED_URI'])] = {'format': settings.get('FEED_FORMAT')}
+
+    feeds.update((str(uri), options) for uri, options in settings.getdict('FEEDS').items())
+    files = []
+
+    for uri, options in feeds.items():
+        path = uri[len('file://'):] if uri.startswith('file://') else uri
+
+        # skip other storages, stdout and uris with parameters (e.g. %(time)s)
+        if '://' in path or path in ('-', 'stdout:') or '%(' in path:
+            continue
+
+        format = options.get('format')
+        if (format == 'csv' and not is_json_lines(path)) or (format in ('jsonlines', 'jsonl', 'jl') and is_json_lines(path)):
+            classes = [load_object(c) if isinstance(c, str) else c for c in options.get('item_classes') or []]
+            files.append((path, classes))
+
+    return files
+
+
+def changelog_path(path):
+    return os.path.splitext(path)[0] + '.changelog.jl'
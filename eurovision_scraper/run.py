@@ -0,0 +1,116 @@
+'''
+    Runs several spiders at once, in a single process and reactor, instead of one
+    `scrapy crawl` after the other. The crawls share the throttling of each host and the
+    request budget (THROTTLE_SHARED) and the snapshot store, and the concurrent requests a
+    single crawl may send to a host are divided between them (see host_concurrency), so
+    that they are as polite together as a single crawl would be.
+
+    e.g.
+        python -m eurovision_scraper.run
+        python -m eurovision_scraper.run eurovision_vote eurovision_results -s LOG_LEVEL=INFO
+        python -m eurovision_scraper.run -a fetch_mode=sections
+
+    The vote, participant and result spiders are run by default. A summary of each crawl is
+    printed once all of them have finished. The exit status is 0 if every crawl finished
+    without errors and 1 otherwise.
+'''
+import argparse
+import sys
+import time
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+DEFAULT_SPIDERS = ['eurovision_vote', 'eurovision_participant', 'eurovision_results']
+
+
+def host_concurrency(settings, crawls):
+    '''
+        The CONCURRENT_REQUESTS_PER_DOMAIN of each of the crawls, so that together they don't
+        have more requests (and connections) open to a host than a single crawl would
+    '''
+    per_host = min(settings.getint('CONCURRENT_REQUESTS'), settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+    return max(1, per_host // max(1, crawls))
+
+
+def parse_pairs(values, option):
+    pairs = {}
+
+    for value in values:
+        name, sep, setting = value.partition('=')
+        if not sep:
+            raise SystemExit(f'Invalid {option} value {value!r}, use NAME=VALUE')
+        pairs[name] = setting
+
+    return pairs
+
+
+def crawl_summary(crawler):
+    '''
+        Returns (spider, finish reason, items, responses, errors, seconds) of a finished crawl
+    '''
+    stats = crawler.stats.get_stats()
+    # errors logged, exceptions raised by the spider and requests that failed on every retry
+    errors = max(stats.get('log_count/ERROR', 0), stats.get('retry/max_reached', 0)) + sum(
+        count for key, count in stats.items() if key.startswith('spider_exceptions/')
+    )
+
+    return (
+        crawler.spidercls.name,
+        stats.get('finish_reason', 'not started'),
+        stats.get('item_scraped_count', 0),
+        stats.get('response_received_count', 0),
+        errors,
+        stats.get('elapsed_time_seconds', 0.0),
+    )
+
+
+def print_summary(summaries, wall_time, file=sys.stdout):
+    print(f"\n{'spider':<26}{'finished':>12}{'items':>10}{'responses':>12}{'errors':>9}{'time (s)':>11}", file=file)
+
+    for name, reason, items, responses, errors, seconds in summaries:
+        print(f'{name:<26}{reason:>12}{items:>10}{responses:>12}{errors:>9}{seconds:>11.1f}', file=file)
+
+    busy = sum(summary[-1] for summary in summaries)
+    print(f'\n{len(summaries)} crawls finished in {wall_time:.1f}s ({busy:.1f}s of crawl time in total)', file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run several spiders concurrently in a single process')
+    parser.add_argument('spiders', nargs='*', default=DEFAULT_SPIDERS, help='spiders to run (default: %(default)s)')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE', help='set a setting of every crawl')
+    parser.add_argument('-a', dest='spargs', action='append', default=[], metavar='NAME=VALUE', help='set a spider argument of every crawl')
+    options = parser.parse_args(argv)
+
+    settings = get_project_settings()
+    settings.set('THROTTLE_SHARED', True, priority='cmdline')
+    settings.setdict(parse_pairs(options.set, '-s'), priority='cmdline')
+    settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', host_concurrency(settings, len(options.spiders)), priority='cmdline')
+
+    process = CrawlerProcess(settings)
+    spider_args = parse_pairs(options.spargs, '-a')
+    crawlers = []
+
+    for name in options.spiders:
+        if name not in process.spider_loader.list():
+            parser.error(f'Unknown spider {name}')
+
+        crawler = process.create_crawler(name)
+        crawlers.append(crawler)
+        process.crawl(crawler, **spider_args)
+
+    start = time.monotonic()
+    process.start()
+    wall_time = time.monotonic() - start
+
+    summaries = [crawl_summary(crawler) for crawler in crawlers]
+    print_summary(summaries, wall_time)
+
+    failed = process.bootstrap_failed or any(
+        reason != 'finished' or errors for _, reason, _, _, errors, _ in summaries
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
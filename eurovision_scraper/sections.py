@@ -0,0 +1,117 @@
+import json
+import os
+import re
+from urllib.parse import urlencode
+
+from scrapy.http import HtmlResponse
+
+# the top level sections that hold the participants, results and voting tables. a section is
+# fetched if its own heading or the heading of any of its subsections matches
+RELEVANT_SECTION_RE = re.compile(r'particip|overview|result|final|voting|scoreboard', re.IGNORECASE)
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def toc_url(api_url, title):
+    '''
+        The parse api url for the table of contents (and current revision id) of an article
+    '''
+    return api_url + '?' + urlencode({
+        'action': 'parse',
+        'page': title,
+        'prop': 'sections|revid',
+        'redirects': 1,
+        'format': 'json',
+        'formatversion': 2,
+    })
+
+
+def section_url(api_url, title, index):
+    '''
+        The parse api url for the rendered html of a single section of an article
+    '''
+    return api_url + '?' + urlencode({
+        'action': 'parse',
+        'page': title,
+        'section': index,
+        'prop': 'text|revid',
+        'disableeditsection': 1,
+        'redirects': 1,
+        'format': 'json',
+        'formatversion': 2,
+    })
+
+
+def relevant_sections(sections):
+    '''
+        Returns the indexes of the top level sections that hold the tables the spiders read,
+        in article order. sections is the 'sections' list of a parse api response
+    '''
+    indexes = []
+
+    for section in sections:
+        if int(section['toclevel']) != 1 or not str(section['index']).isdigit():
+            continue
+
+        number = section['number']
+        family = [s for s in sections if s['number'] == number or s['number'].startswith(number + '.')]
+
+        if any(RELEVANT_SECTION_RE.search(TAG_RE.sub('', s['line'])) for s in family):
+            indexes.append(str(section['index']))
+
+    return indexes
+
+
+def assemble_article(url, revision, fragments):
+    '''
+        Returns a response for the article url that holds only the provided section fragments,
+        in the order they were given. The revision id is embedded the same way as in a full
+        article, so that the page can be told apart from other revisions (see page_revision)
+    '''
+    body = (
+        '<html><head><script>RLCONF={"wgRevisionId":%s};</script></head><body>%s</body></html>'
+        % (int(revision), ''.join(fragments))
+    )
+    return HtmlResponse(url=url, body=body.encode('utf-8'), encoding='utf-8')
+
+
+class TocIndex:
+    '''
+        The table of contents of every contest article, as of the last time it was fetched,
+        so that later crawls can request the relevant sections straight away:
+
+        {
+            "Eurovision_Song_Contest_1957": {
+                "revision": 1234,
+                "sections": [{"index": "1", "number": "1", "toclevel": 1, "line": "Participants"}, ...]
+            }
+        }
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.articles = {}
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.articles = json.load(f)
+
+    def get(self, title):
+        return self.articles.get(title)
+
+    def update(self, title, revision, sections):
+        self.articles[title] = {
+            'revision': revision,
+            'sections': [
+                {key: section[key] for key in ('index', 'number', 'toclevel', 'line')}
+                for section in sections
+            ],
+        }
+        return self.articles[title]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.articles, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -11,6 +11,7 @@ BOT_NAME = "eurovision_scraper"
 
 SPIDER_MODULES = ["eurovision_scraper.spiders"]
 NEWSPIDER_MODULE = "eurovision_scraper.spiders"
+COMMANDS_MODULE = "eurovision_scraper.commands"
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -20,7 +21,8 @@ NEWSPIDER_MODULE = "eurovision_scraper.spiders"
 ROBOTSTXT_OBEY = True
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-CONCURRENT_REQUESTS = 1
+# The requests are paced by AdaptiveThrottleMiddleware, see the THROTTLE_* settings below
+CONCURRENT_REQUESTS = 4
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
@@ -47,12 +49,23 @@ CONCURRENT_REQUESTS = 1
 #SPIDER_MIDDLEWARES = {
 #    "eurovision_scraper.middlewares.EurovisionScraperSpiderMiddleware": 543,
 #}
+SPIDER_MIDDLEWARES = {
+    "eurovision_scraper.middlewares.IncrementalSpiderMiddleware": 543,
+    "eurovision_scraper.middlewares.ParseStatsMiddleware": 950,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #DOWNLOADER_MIDDLEWARES = {
 #    "eurovision_scraper.middlewares.EurovisionScraperDownloaderMiddleware": 543,
 #}
+# the snapshot middleware sits below HttpCompressionMiddleware (590) so that decompressed
+# bodies are stored
+DOWNLOADER_MIDDLEWARES = {
+    "eurovision_scraper.middlewares.IncrementalDownloaderMiddleware": 570,
+    "eurovision_scraper.middlewares.SnapshotMiddleware": 580,
+    "eurovision_scraper.middlewares.AdaptiveThrottleMiddleware": 950,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -62,9 +75,32 @@ CONCURRENT_REQUESTS = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "eurovision_scraper.pipelines.EurovisionScraperPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "eurovision_scraper.pipelines.CountryPipeline": 50,
+    "eurovision_scraper.pipelines.DedupPipeline": 100,
+    "eurovision_scraper.pipelines.ChangelogPipeline": 200,
+    "eurovision_scraper.pipelines.SqlitePipeline": 300,
+}
+
+# Drop rows whose key (year, round, country, votingCountry and voteType for votes; year and
+# country for participants; year, country and running order for results) was already
+# scraped. With DEDUP_PERSIST the hashed keys are kept in .scrapy/dedup/ across crawls, for
+# feeds that are appended to
+DEDUP_ENABLED = True
+DEDUP_PERSIST = False
+DEDUP_DIR = "dedup"
+
+# Write a changelog next to each csv or JSON lines feed (e.g. eurovision_vote_data.changelog.jl),
+# with the rows inserted, updated and deleted since the previous crawl, grouped by year (see
+# pipelines.ChangelogPipeline). Enable with -s CHANGELOG_ENABLED=True
+CHANGELOG_ENABLED = False
+
+# The SQLite store of the vote, participant and result rows (see pipelines.SqlitePipeline),
+# disabled unless a database file is set, e.g. -s SQLITE_DATABASE=eurovision.db. Every year
+# that is crawled replaces that year's rows in the store. rows are inserted in batches of
+# SQLITE_BATCH_SIZE, one transaction per batch
+SQLITE_DATABASE = None
+SQLITE_BATCH_SIZE = 1000
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -87,12 +123,92 @@ CONCURRENT_REQUESTS = 1
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
+# Store every fetched page in a compressed snapshot store (see snapshots.py). A spider can
+# then be re-run entirely from the store, without any network access, via:
+#   scrapy crawl <spider> --replay
+SNAPSHOT_ENABLED = True
+SNAPSHOT_REPLAY = False
+SNAPSHOT_DIR = "snapshots"
+# the number of revisions kept per article and the max size of the store (0 is unlimited)
+SNAPSHOT_MAX_REVISIONS = 3
+SNAPSHOT_MAX_BYTES = 0
+
+# Incremental crawls (scrapy crawl <spider> --incremental) send conditional requests for
+# articles that were crawled before and reuse the previous rows of unchanged articles
+INCREMENTAL_ENABLED = False
+INCREMENTAL_DIR = "incremental"
+
+# Keep the table locator that found each table of each year in .scrapy/locators/<spider>.json,
+# so that later crawls try it first. A table that is found by a different locator than in the
+# last crawl is logged as a warning (and counted in the locators/changed stat)
+LOCATOR_CACHE_ENABLED = True
+LOCATOR_CACHE_DIR = "locators"
+
+# Per article parse instrumentation (parse time, xpath evaluations, rows per round and vote
+# type, matched table locators), added to the crawl stats and saved as a JSON report in
+# .scrapy/parse_stats/<spider>.json
+PARSE_STATS_ENABLED = True
+PARSE_STATS_DIR = "parse_stats"
+
+# The parser used for the voting tables: 'selector' (scrapy selectors) or 'lxml' (walks the
+# lxml tree directly, faster with the same output). Can also be set with -a backend=lxml
+VOTE_PARSER_BACKEND = "selector"
+
+# Number of worker processes that parse the articles of the eurovision_all spider, so that
+# downloads and parsing overlap and parsing can use several cores. 0 parses in the crawl process
+PARSE_PROCESSES = 0
+
+# Adaptive per host throttling (AdaptiveThrottleMiddleware) instead of a fixed DOWNLOAD_DELAY.
+# Rates are in requests per second, the rate of each host follows the response latency and
+# is cut on 429/503 responses, which are retried after their Retry-After. THROTTLE_BUDGET caps
+# the number of requests of a crawl (0 is unlimited). Set a DOWNLOAD_DELAY when disabling this
+THROTTLE_ENABLED = True
+THROTTLE_START_RATE = 0.5
+THROTTLE_MIN_RATE = 0.1
+THROTTLE_MAX_RATE = 4.0
+THROTTLE_BURST = 1
+THROTTLE_TARGET_CONCURRENCY = 1.0
+THROTTLE_BACKOFF = 0.5
+THROTTLE_MAX_RETRIES = 5
+THROTTLE_MAX_RETRY_AFTER = 300
+THROTTLE_BUDGET = 0
+# Share the host rates and the request budget between all the crawls running in the same
+# process (set by python -m eurovision_scraper.run)
+THROTTLE_SHARED = False
+
+# Watch mode (scrapy crawl <spider> -a watch=<year>): the article is polled every WATCH_INTERVAL
+# seconds, the longest a change waits before it's written out, and the changed rows are
+# written to WATCH_OUTPUT as JSON lines ("-" is stdout). Polls are still paced by the throttle,
+# so an interval below 1 / THROTTLE_START_RATE is only kept once the host rate has gone up
+WATCH_INTERVAL = 5
+WATCH_OUTPUT = "-"
+
+# The wiki that the contest articles are fetched from
+WIKI_BASE_URL = "https://en.wikipedia.org/wiki/"
+
+# How the articles are fetched: "article" (the full rendered article) or "sections" (only the
+# sections with the participants, results and voting tables, through the parse api)
+FETCH_MODE = "article"
+WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+
+# The artist and song lookups of the eurovision_enrichment spider: the participant csv the wiki
+# urls are read from, the titles per query api request (at most 50) and the directory in .scrapy
+# where the metadata of every title is kept for later crawls
+ENRICHMENT_SOURCE = "eurovision_participant_data.csv"
+ENRICHMENT_BATCH_SIZE = 50
+ENRICHMENT_CACHE_DIR = "enrichment"
+
+# Typed columnar feed formats (need pyarrow), e.g. scrapy crawl eurovision_vote -O votes.parquet
+FEED_EXPORTERS = {
+    "parquet": "eurovision_scraper.exporters.ParquetItemExporter",
+    "arrow": "eurovision_scraper.exporters.ArrowItemExporter",
+}
+
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
 ROBOTSTXT_OBEY = True
-DOWNLOAD_DELAY = 2
 FEED_FORMAT = 'csv'
 FEED_URI = 'eurovision_data.csv'
\ No newline at end of file
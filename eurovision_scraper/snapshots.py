@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+# the numeric id of the article revision that was rendered, embedded in every wiki page
+REVISION_RE = re.compile(rb'"wgRevisionId"\s*:\s*(\d+)')
+
+
+def page_revision(body):
+    '''
+        Returns the wiki revision id of the provided page body, or None if the page doesn't
+        contain one
+    '''
+    match = REVISION_RE.search(body)
+    return match.group(1).decode() if match else None
+
+
+class SnapshotStore:
+    '''
+        Content addressed store for fetched pages.
+
+        Page bodies are gzip compressed and saved under the sha256 digest of their contents,
+        so a revision that is fetched repeatedly (or shared between urls) is only stored once.
+        An index file maps each url to the revisions stored for it, newest last:
+
+        {
+            "https://en.wikipedia.org/wiki/Eurovision_Song_Contest_1957": [
+                {"revision": "1234", "digest": "ab12...", "size": 5123, "headers": {...},
+                 "stored": 1700000000.0, "accessed": 1700000000.0}
+            ]
+        }
+
+        Old revisions are evicted once a url has more than max_revisions entries, and the least
+        recently accessed revisions are evicted while the compressed blobs exceed max_bytes
+    '''
+
+    def __init__(self, path, max_revisions=3, max_bytes=None):
+        self.path = path
+        self.max_revisions = max_revisions
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(path, 'index.json')
+        self.index = {}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def blob_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.gz')
+
+    def put(self, url, body, headers=None, revision=None):
+        '''
+            Store the body fetched from the provided url and return its digest. If the same
+            revision is already stored for the url, only its timestamps are updated
+        '''
+        digest = hashlib.sha256(body).hexdigest()
+        revision = revision or page_revision(body) or digest
+        blob_path = self.blob_path(digest)
+
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = blob_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(body))
+            os.replace(tmp_path, blob_path)
+
+        now = time.time()
+        entries = [e for e in self.index.get(url, []) if e['revision'] != revision]
+        entries.append({
+            'revision': revision,
+            'digest': digest,
+            'size': os.path.getsize(blob_path),
+            'headers': headers or {},
+            'stored': now,
+            'accessed': now
+        })
+        self.index[url] = entries
+
+        return digest
+
+    def get(self, url, revision=None):
+        '''
+            Returns a (body, entry) tuple for the provided url, or None if nothing is stored.
+            The newest revision is returned unless a specific revision is requested
+        '''
+        entries = self.index.get(url)
+        if not entries:
+            return None
+
+        if revision is None:
+            entry = entries[-1]
+        else:
+            entry = next((e for e in entries if e['revision'] == str(revision)), None)
+            if entry is None:
+                return None
+
+        blob_path = self.blob_path(entry['digest'])
+        if not os.path.exists(blob_path):
+            return None
+
+        with open(blob_path, 'rb') as f:
+            body = gzip.decompress(f.read())
+
+        entry['accessed'] = time.time()
+        return body, entry
+
+    def revisions(self, url):
+        return [e['revision'] for e in self.index.get(url, [])]
+
+    def evict(self):
+        '''
+            Drop revisions beyond max_revisions per url, then the least recently accessed
+            revisions while the store is larger than max_bytes. Blobs that are no longer
+            referenced by any url are deleted. Returns the number of evicted revisions
+        '''
+        evicted = 0
+
+        for url, entries in self.index.items():
+            if self.max_revisions and len(entries) > self.max_revisions:
+                evicted += len(entries) - self.max_revisions
+                self.index[url] = entries[-self.max_revisions:]
+
+        if self.max_bytes:
+            # blobs shared between entries only count once towards the store size
+            sizes = {e['digest']: e['size'] for entries in self.index.values() for e in entries}
+            total = sum(sizes.values())
+
+            candidates = sorted(
+                ((e['accessed'], url, e) for url, entries in self.index.items() for e in entries),
+                key=lambda c: c[0]
+            )
+
+            for _, url, entry in candidates:
+                if total <= self.max_bytes:
+                    break
+
+                self.index[url].remove(entry)
+                evicted += 1
+
+                if not any(e['digest'] == entry['digest'] for entries in self.index.values() for e in entries):
+                    total -= sizes[entry['digest']]
+
+            self.index = {url: entries for url, entries in self.index.items() if entries}
+
+        self.remove_orphaned_blobs()
+        return evicted
+
+    def remove_orphaned_blobs(self):
+        referenced = {e['digest'] for entries in self.index.values() for e in entries}
+        objects_path = os.path.join(self.path, 'objects')
+
+        if not os.path.isdir(objects_path):
+            return
+
+        for prefix in os.listdir(objects_path):
+            for name in os.listdir(os.path.join(objects_path, prefix)):
+                if name.endswith('.gz') and name[:-3] not in referenced:
+                    os.remove(os.path.join(objects_path, prefix, name))
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,347 @@
+import os
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.project import data_path
+from eurovision_scraper.locators import LocatorCache
+from eurovision_scraper.parse_stats import attach_probe
+from eurovision_scraper.sections import TocIndex, assemble_article, relevant_sections, section_url, toc_url
+from eurovision_scraper.watch import DeltaWriter, TableWatch, table_digest
+
+# every contest year with an article. note that we're skipping 2020 (the contest was cancelled)
+CONTEST_YEARS = list(range(1956, 2020)) + list(range(2021, 2025))
+
+WIKI_BASE_URL = 'https://en.wikipedia.org/wiki/'
+WIKI_API_URL = 'https://en.wikipedia.org/w/api.php'
+
+
+def contest_url(year, base_url=WIKI_BASE_URL):
+    return f'{base_url}Eurovision_Song_Contest_{year}'
+
+
+def parse_years(value, years=CONTEST_YEARS):
+    '''
+        Returns the contest years selected by a years argument: a comma separated list of
+        years and year ranges, e.g. '1990-1999' or '1956,1970-1979,2021-'. An open ended range
+        runs from the first or to the last contest year
+    '''
+    selected = set()
+
+    for part in str(value).split(','):
+        part = part.strip()
+        if not part:
+            continue
+
+        first, sep, last = part.partition('-')
+
+        try:
+            first = int(first) if first.strip() else min(years)
+            last = (int(last) if last.strip() else max(years)) if sep else first
+        except ValueError:
+            raise ValueError(f'Invalid years {value!r}, expected e.g. 1990-1999 or 1990,1995') from None
+
+        selected.update(year for year in years if first <= year <= last)
+
+    return sorted(selected)
+
+
+class ContestSpider(scrapy.Spider):
+    '''
+        Base class for the spiders that crawl the wiki article of each contest year. The
+        articles are requested from the WIKI_BASE_URL setting, which can be pointed at a
+        local server (e.g. -s WIKI_BASE_URL=http://localhost:8000/wiki/)
+
+        With -a fetch_mode=sections (or the FETCH_MODE setting) only the sections of each
+        article that hold the participants, results and voting tables are requested, through
+        the parse api at WIKI_API_URL. The sections are put back together into a page for the
+        article url, which is then parsed as usual. The api requests don't obey robots.txt,
+        which disallows every /w/ url for crawlers: they are api calls rather than pages. The table of contents of each article is
+        kept in .scrapy/toc/, so that later crawls can request the sections straight away
+
+        The locator that found each table of each year is kept in .scrapy/locators/<spider>.json
+        (see LocatorCache), so that later crawls try it before any other locator
+
+        With -a watch=2025 the article of that year is polled every WATCH_INTERVAL seconds
+        until the crawl is stopped, and the rows that changed are written to WATCH_OUTPUT as
+        JSON lines (see watch.py). Spiders that support it provide watched_tables
+
+        With -a years=1990-1999 only the articles of those years are crawled (see parse_years),
+        so that a crawl can be split into shards whose output is merged afterwards (see merge.py)
+    '''
+    contest_years = CONTEST_YEARS
+    start_urls = [contest_url(year) for year in CONTEST_YEARS]
+
+    # how the articles are fetched, either 'article' (the full rendered article) or 'sections'
+    fetch_mode = None
+
+    # the years to crawl (e.g. -a years=1990-1999), every contest year if not set
+    years = None
+
+    # the table locators of the last crawl, if LOCATOR_CACHE_ENABLED is set
+    locator_cache = None
+
+    # the year whose article is polled in watch mode (e.g. -a watch=2025)
+    watch = None
+    watch_call = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        if spider.watch:
+            spider.start_watch(crawler)
+        elif spider.years:
+            spider.contest_years = parse_years(spider.years, cls.contest_years)
+
+        base_url = crawler.settings.get('WIKI_BASE_URL', WIKI_BASE_URL)
+        spider.start_urls = [contest_url(year, base_url) for year in spider.contest_years]
+        spider.api_url = crawler.settings.get('WIKI_API_URL', WIKI_API_URL)
+        spider.fetch_mode = spider.fetch_mode or crawler.settings.get('FETCH_MODE', 'article')
+
+        if spider.fetch_mode not in ('article', 'sections'):
+            raise ValueError(f'Invalid fetch mode {spider.fetch_mode}')
+
+        if crawler.settings.getbool('LOCATOR_CACHE_ENABLED'):
+            locator_dir = data_path(crawler.settings.get('LOCATOR_CACHE_DIR', 'locators'), createdir=True)
+            spider.locator_cache = LocatorCache(os.path.join(locator_dir, f'{spider.name}.json'))
+            # connected to the signal rather than closed(), as the extractors of eurovision_all
+            # aren't the crawler's spider
+            crawler.signals.connect(spider.save_locator_cache, signal=signals.spider_closed)
+
+        return spider
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        if self.watch:
+            yield self.watch_request(self.start_urls[0])
+            return
+
+        if self.fetch_mode != 'sections':
+            for url in self.start_urls:
+                yield scrapy.Request(url, dont_filter=True)
+            return
+
+        self.toc_index = TocIndex(os.path.join(data_path('toc', createdir=True), 'toc.json'))
+
+        for url in self.start_urls:
+            title = url.rsplit('/', 1)[-1]
+            toc = self.toc_index.get(title)
+
+            if toc is None:
+                yield self.toc_request(url, title)
+            else:
+                yield from self.section_requests(url, title, toc)
+
+    def toc_request(self, url, title, refreshed=False):
+        # the parse api is called, not crawled: robots.txt disallows /w/ for every crawler
+        return scrapy.Request(
+            toc_url(self.api_url, title),
+            callback=self.parse_toc,
+            cb_kwargs={'url': url, 'title': title, 'refreshed': refreshed},
+            meta={'dont_obey_robotstxt': True},
+            dont_filter=True
+        )
+
+    def parse_toc(self, response, url, title, refreshed):
+        data = self.parse_api_response(response)
+        if data is None:
+            return
+
+        toc = self.toc_index.update(title, data['revid'], data['sections'])
+
+        yield from self.section_requests(url, title, toc, refreshed)
+
+    def section_requests(self, url, title, toc, refreshed=False):
+        sections = relevant_sections(toc['sections'])
+
+        if not sections:
+            # the headings don't look like a contest article, read the whole article instead
+            self.logger.warning(f'No sections with tables found for {title}, fetching the full article')
+            yield scrapy.Request(url, dont_filter=True)
+            return
+
+        yield self.section_request(url, title, sections, [], refreshed)
+
+    def section_request(self, url, title, sections, fragments, refreshed):
+        # the sections of an article are fetched one after the other, the last one assembles
+        # the page from all of the fragments
+        return scrapy.Request(
+            section_url(self.api_url, title, sections[0]),
+            callback=self.parse_section,
+            cb_kwargs={'url': url, 'title': title, 'sections': sections, 'fragments': fragments, 'refreshed': refreshed},
+            meta={'dont_obey_robotstxt': True},
+            dont_filter=True
+        )
+
+    async def parse_section(self, response, url, title, sections, fragments, refreshed):
+        data = self.parse_api_response(response)
+        if data is None:
+            return
+
+        # the section numbers may have moved if the article was edited since its table of
+        # contents was indexed, so fetch the table of contents again (once)
+        if str(data['revid']) != str(self.toc_index.get(title)['revision']) and not refreshed:
+            yield self.toc_request(url, title, refreshed=True)
+            return
+
+        fragments = fragments + [data['text']]
+
+        if len(sections) > 1:
+            yield self.section_request(url, title, sections[1:], fragments, refreshed)
+            return
+
+        article = assemble_article(url, data['revid'], fragments)
+        attach_probe(response, article)
+
+        # the spider's parse may be a plain or an async generator (see EurovisionAllSpider)
+        output = self.parse(article)
+
+        if hasattr(output, '__aiter__'):
+            async for i in output:
+                yield i
+        else:
+            for i in output or []:
+                yield i
+
+    def locator_order(self, year, table, locators, generic=()):
+        '''
+            Returns the table locators to try in turn, the one that found the table in the last
+            crawl first unless it's one of the generic fallbacks (see LocatorCache.order)
+        '''
+        if self.locator_cache is None:
+            return list(locators)
+
+        return self.locator_cache.order(year, table, locators, generic)
+
+    def locator_found(self, year, table, locator):
+        '''
+            Record the locator that found a table (None if none did) for the next crawl
+        '''
+        if self.locator_cache is None:
+            return
+
+        cached = self.locator_cache.get(year, table)
+        self.locator_cache.found(year, table, locator)
+
+        if cached is None:
+            self.crawler.stats.inc_value('locators/searched' if locator else 'locators/missing')
+        elif cached == locator:
+            self.crawler.stats.inc_value('locators/cached')
+        else:
+            self.crawler.stats.inc_value('locators/changed')
+            self.logger.warning(f'The {table} table of {year} was found with "{cached}" in the last crawl, now with "{locator}"')
+
+    def start_watch(self, crawler):
+        if not hasattr(self, 'watched_tables'):
+            raise ValueError(f'The {self.name} spider has no watch mode')
+
+        if crawler.settings.getbool('INCREMENTAL_ENABLED'):
+            raise ValueError('Watch mode sends its own conditional requests, it can\'t be combined with --incremental')
+
+        try:
+            # the watched year may not have an article yet, so it isn't checked against the contest years
+            self.contest_years = [int(self.watch)]
+        except ValueError:
+            raise ValueError(f'Invalid watch year {self.watch!r}') from None
+
+        self.watch_interval = crawler.settings.getfloat('WATCH_INTERVAL', 5)
+        self.watch_validators = {}
+        self.table_watch = TableWatch()
+        self.delta_writer = DeltaWriter(crawler.settings.get('WATCH_OUTPUT', '-'))
+        crawler.signals.connect(self.keep_watching, signal=signals.spider_idle)
+
+    def watch_request(self, url):
+        # a 404 is polled again too, the article of the year may not have been written yet
+        return scrapy.Request(
+            url,
+            callback=self.parse_watch,
+            errback=self.watch_failed,
+            headers=self.watch_validators,
+            meta={'handle_httpstatus_list': [304, 404]},
+            dont_filter=True
+        )
+
+    def parse_watch(self, response):
+        '''
+            Parses the tables of the watched article whose html changed since the last poll
+            and writes out the rows that changed, then schedules the next poll
+        '''
+        stats = self.crawler.stats
+        stats.inc_value('watch/polls')
+
+        try:
+            if response.status == 304:
+                stats.inc_value('watch/not_modified')
+
+            elif response.status == 200:
+                self.update_tables(response)
+
+                self.watch_validators = {
+                    header: response.headers[name].decode('latin-1')
+                    for name, header in (('ETag', 'If-None-Match'), ('Last-Modified', 'If-Modified-Since'))
+                    if response.headers.get(name)
+                }
+        finally:
+            # the interval runs from the time the poll was sent. an article that couldn't be
+            # parsed is polled again too, it may be in the middle of being edited
+            self.schedule_poll(response.url, self.watch_interval - response.meta.get('download_latency', 0))
+
+        return []
+
+    def update_tables(self, response):
+        stats = self.crawler.stats
+        year = response.url.split('_')[-1]
+
+        for name, table, parse in self.watched_tables(response, year):
+            digest = table_digest(table)
+            if not self.table_watch.changed(name, digest):
+                continue
+
+            # a table that was removed from the article (or isn't there yet) has no rows
+            changes = self.table_watch.update(name, digest, parse() if digest else [])
+
+            if changes:
+                self.delta_writer.write(name, changes)
+                stats.inc_value('watch/tables_changed')
+                stats.inc_value('watch/changes', len(changes))
+
+    def watch_failed(self, failure):
+        self.logger.warning(f'Polling {failure.request.url} failed: {failure.value!r}')
+        self.schedule_poll(failure.request.url, self.watch_interval)
+
+    def schedule_poll(self, url, delay):
+        # imported here, importing the reactor at module level would install the default one
+        from twisted.internet import reactor
+
+        self.watch_call = reactor.callLater(max(0, delay), self.crawler.engine.crawl, self.watch_request(url))
+
+    def keep_watching(self, spider):
+        # the spider is idle between polls, it keeps running until the crawl is stopped
+        raise DontCloseSpider
+
+    def save_locator_cache(self, spider):
+        # not set for the extractors of eurovision_all with PARSE_PROCESSES
+        if self.locator_cache is not None:
+            self.locator_cache.save()
+
+    def parse_api_response(self, response):
+        # api errors (e.g. a missing page or section) are sent with a 200 status
+        data = response.json()
+
+        if 'error' in data:
+            self.logger.error(f"Error fetching {response.url}: {data['error'].get('info')}")
+            return None
+
+        return data['parse']
+
+    def closed(self, reason):
+        if hasattr(self, 'toc_index'):
+            self.toc_index.save()
+
+        if self.watch:
+            if self.watch_call is not None and self.watch_call.active():
+                self.watch_call.cancel()
+            self.delta_writer.close()
@@ -1,3 +1,7 @@
+import re
+import unicodedata
+from sys import intern
+
 country_map = {
     'Albania': 'al',
     'Andorra': 'ad',
@@ -55,4 +59,81 @@ country_map = {
     'Ukraine': 'ua',
     'United Kingdom': 'gb',
     'Yugoslavia': 'yu'
-}
\ No newline at end of file
+}
+
+
+# other names that the articles use for some of the countries. the historic entities
+# (Yugoslavia, Serbia and Montenegro) have codes of their own in country_map
+country_aliases = {
+    'The Netherlands': 'nl',
+    'Holland': 'nl',
+    'West Germany': 'de',
+    'Great Britain': 'gb',
+    'UK': 'gb',
+    'Russian Federation': 'ru',
+    'Türkiye': 'tr',
+    'FYR Macedonia': 'mk',
+    'F.Y.R. Macedonia': 'mk',
+    'Former Yugoslav Republic of Macedonia': 'mk',
+    'SFR Yugoslavia': 'yu',
+    'Rest of the World': 'row',
+}
+
+# footnote markers in table cells, e.g. 'Germany[a]' or 'Italy†'
+FOOTNOTE_RE = re.compile(r'\[[^\]]*\]|[*†‡§]')
+
+
+def normalise_name(name):
+    '''
+        The form of a country name that the index is keyed on: Unicode (NFKC) normalised,
+        without footnote markers, with '&' spelled out, whitespace collapsed, case folded and
+        without a leading 'the'
+    '''
+    name = FOOTNOTE_RE.sub('', unicodedata.normalize('NFKC', name))
+    name = ' '.join(name.replace('&', ' and ').split()).casefold()
+    return name[4:] if name.startswith('the ') else name
+
+
+class CountryIndex:
+    '''
+        The code of every country name, alias and historic entity, keyed on the normalised
+        form of the name (see normalise_name), so that a cell with a footnote or a
+        non-breaking space finds the same code as the plain name. Lookups are memoised by the
+        raw cell text, a crawl only normalises each distinct text once
+    '''
+
+    def __init__(self, names):
+        self.names = {normalise_name(name): intern(code) for name, code in names.items()}
+        self.codes = frozenset(self.names.values())
+        self.lookups = {}
+
+    def code(self, name):
+        '''
+            Returns the code of a country name, None if it isn't the name of a country
+        '''
+        try:
+            return self.lookups[name]
+        except KeyError:
+            code = self.lookups[name] = self.names.get(normalise_name(name))
+            return code
+
+    def normalise(self, value):
+        '''
+            Returns the code of a country name or code, None if it's neither
+        '''
+        if value in self.codes:
+            return value
+
+        return self.code(value)
+
+
+country_index = CountryIndex({**country_map, **country_aliases})
+
+
+def country_code(country):
+    '''
+        Returns the code of a country name (or the name itself if it has no code). The result
+        is interned, so that the rows of a crawl share a single copy of each code
+    '''
+    code = country_index.normalise(country)
+    return code if code is not None else intern(country)
@@ -0,0 +1,165 @@
+import asyncio
+from scrapy import signals
+from eurovision_scraper.items import VoteItem, ParticipantItem, ResultItem
+from eurovision_scraper.spiders.eurovision_vote_spider import EurovisionSpider as EurovisionVoteSpider
+from eurovision_scraper.spiders.eurovision_participant_spider import EurovisionSpider as EurovisionParticipantSpider
+from eurovision_scraper.spiders.eurovision_results import EurovisionResultsSpider
+from eurovision_scraper.spiders.contest_spider import ContestSpider
+from eurovision_scraper.parse_pool import parse_pool, extract
+from eurovision_scraper.parse_stats import probe_for
+
+
+class EurovisionAllSpider(ContestSpider):
+    '''
+        Fetch each contest article once and run the vote, participant and result extractors
+        over the same response. The rows are written to the same three CSV files (with the
+        same columns) that the individual spiders produce:
+
+        eurovision_vote_data.csv
+        eurovision_participant_data.csv
+        eurovision_result_data.csv
+
+        With -s PARSE_PROCESSES=N the articles are parsed by N worker processes instead (see
+        parse_pool.py), so that downloads continue while articles are parsed and the parsing
+        is spread over several cores. The table locator cache isn't used then (see LocatorCache)
+
+        If any of the extractors fails on an article, the rows of the others are still
+        returned but the article fails as a whole, so an incremental crawl parses it again
+    '''
+    custom_settings = {
+        # don't also write the mixed rows to the project wide FEED_URI file. the feeds are
+        # overwritten (rather than appended to) so that an incremental crawl, which emits the
+        # previous rows of unchanged articles, doesn't duplicate rows
+        'FEED_URI': None,
+        'FEEDS': {
+            'eurovision_vote_data.csv': {
+                'format': 'csv',
+                'overwrite': True,
+                'item_classes': [VoteItem],
+                'fields': ['year', 'round', 'country', 'votingCountry', 'voteType', 'points'],
+            },
+            'eurovision_participant_data.csv': {
+                'format': 'csv',
+                'overwrite': True,
+                'item_classes': [ParticipantItem],
+                'fields': EurovisionParticipantSpider.custom_settings['FEED_EXPORT_FIELDS'],
+            },
+            'eurovision_result_data.csv': {
+                'format': 'csv',
+                'overwrite': True,
+                'item_classes': [ResultItem],
+                'fields': EurovisionResultsSpider.custom_settings['FEED_EXPORT_FIELDS'],
+            },
+        }
+    }
+
+    name = 'eurovision_all'
+
+    # the single page spiders are only used for their parse logic here, they are never
+    # scheduled themselves. each of them yields its own item type
+    extractor_classes = [
+        EurovisionVoteSpider,
+        EurovisionParticipantSpider,
+        EurovisionResultsSpider,
+    ]
+
+    # the pool of parse worker processes, if PARSE_PROCESSES is set
+    executor = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spider_kwargs = kwargs
+        self.extractors = [spider_class(*args, **kwargs) for spider_class in self.extractor_classes]
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        # give the extractors access to the crawler settings (and any spider arguments) too
+        spider.extractors = [spider_class.from_crawler(crawler, *args, **kwargs)
+                             for spider_class in cls.extractor_classes]
+
+        processes = crawler.settings.getint('PARSE_PROCESSES')
+        if processes > 0:
+            spider.executor = parse_pool(processes)
+            crawler.signals.connect(spider.shutdown_pool, signal=signals.spider_closed)
+
+            # the extractors of the worker processes have no crawler, and so no locator cache:
+            # the cache of the last crawl is left as it is rather than half updated
+            if any(extractor.locator_cache is not None for extractor in spider.extractors):
+                spider.logger.info('The table locator cache is not used with PARSE_PROCESSES')
+                for extractor in spider.extractors:
+                    extractor.locator_cache = None
+
+        return spider
+
+    def parse(self, response):
+        if self.executor is not None:
+            return self.parse_offloaded(response)
+
+        return self.parse_in_process(response)
+
+    def parse_in_process(self, response):
+        error = None
+
+        for extractor in self.extractors:
+            try:
+                yield from extractor.parse(response) or []
+
+            except Exception as e:
+                # a broken table for one feed shouldn't prevent the other feeds from being parsed
+                self.logger.error(f"Error running {extractor.name} on {response.url}: {e}")
+                error = error or e
+
+        # the article still fails, so that an incremental crawl doesn't record it as parsed
+        # and parses it again next time
+        if error is not None:
+            raise error
+
+    async def parse_offloaded(self, response):
+        '''
+            Parse the article in a worker process. Only the body is sent to the worker, which
+            returns the items, so the reactor keeps downloading (and handing other articles to
+            the pool) in the meantime
+        '''
+        probe = probe_for(response)
+
+        future = self.executor.submit(
+            extract, response.url, response.body, response.encoding,
+            self.extractor_specs(), instrument=probe is not None
+        )
+        rows, errors, stats = await asyncio.wrap_future(future)
+
+        for i, message in errors:
+            self.logger.error(f"Error running {self.extractors[i].name} on {response.url}: {message}")
+
+        if probe is not None:
+            probe.merge(stats)
+
+        for _, item in rows:
+            yield item
+
+        # as in parse_in_process, the article fails once the rows of the other feeds are out
+        if errors:
+            names = ', '.join(self.extractors[i].name for i, _ in errors)
+            raise Exception(f'Error running {names} on {response.url}')
+
+    def extractor_specs(self):
+        '''
+            The (class path, spider kwargs) of each extractor, for building the same extractors
+            in the worker processes. Settings aren't available there, so the vote parser backend
+            is passed on as an argument
+        '''
+        specs = []
+
+        for extractor in self.extractors:
+            kwargs = dict(self.spider_kwargs)
+            if getattr(extractor, 'backend', None):
+                kwargs['backend'] = extractor.backend
+
+            specs.append((f'{type(extractor).__module__}.{type(extractor).__qualname__}', kwargs))
+
+        return specs
+
+    def shutdown_pool(self, spider):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,162 @@
+import csv
+import os
+from urllib.parse import urlencode
+import scrapy
+from scrapy.utils.project import data_path
+from eurovision_scraper.enrichment import (
+    MAX_TITLES, EnrichmentCache, page_metadata, query_url, resolved_titles, wiki_title
+)
+from eurovision_scraper.items import EnrichmentItem
+from eurovision_scraper.spiders.contest_spider import WIKI_API_URL
+
+
+class EurovisionEnrichmentSpider(scrapy.Spider):
+    '''
+        Looks up the wiki page of every artist and song of the participant data (the
+        artistWikiUrl and songWikiUrl columns of eurovision_participant_data.csv) and returns
+        a few fields of each page's infobox in the following CSV format:
+
+        url,kind,title,pageId,birthYear,origin,genre,length
+
+        e.g.
+        https://en.wikipedia.org/wiki/ABBA,artist,ABBA,2350,,"Stockholm, Sweden",Pop|Europop,
+
+        Each page is looked up once, however many entries link to it. The lead section of the
+        pages (which holds the infobox) is requested through the query api at WIKI_API_URL,
+        ENRICHMENT_BATCH_SIZE titles (at most 50) per request, so the whole participant data
+        takes a few dozen requests. The metadata of
+        every title is kept in .scrapy/enrichment/pages.json, later crawls only request the
+        titles that weren't looked up before (-a refresh=1 requests every title again)
+
+        The participant file can be set with -a participants=<csv> (or ENRICHMENT_SOURCE)
+    '''
+    custom_settings = {
+        'FEED_URI': 'eurovision_enrichment_data.csv',
+        'FEED_EXPORT_FIELDS': ['url', 'kind', 'title', 'pageId', 'birthYear', 'origin', 'genre', 'length'],
+    }
+
+    name = 'eurovision_enrichment'
+
+    # the participant csv to read the wiki urls from
+    participants = None
+
+    # look every title up again, rather than reusing the metadata of earlier crawls
+    refresh = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+
+        spider.participants = spider.participants or settings.get('ENRICHMENT_SOURCE', 'eurovision_participant_data.csv')
+        spider.api_url = settings.get('WIKI_API_URL', WIKI_API_URL)
+        spider.batch_size = max(1, min(MAX_TITLES, settings.getint('ENRICHMENT_BATCH_SIZE', MAX_TITLES)))
+
+        cache_dir = data_path(settings.get('ENRICHMENT_CACHE_DIR', 'enrichment'), createdir=True)
+        spider.cache = EnrichmentCache(os.path.join(cache_dir, 'pages.json'))
+
+        return spider
+
+    async def start(self):
+        pages = self.wiki_pages()
+        titles = []
+
+        for title, (url, kind) in pages.items():
+            metadata = None if self.refresh else self.cache.get(title)
+
+            if metadata is None:
+                titles.append(title)
+            else:
+                self.crawler.stats.inc_value('enrichment/cached')
+                yield self.item(url, kind, metadata)
+
+        self.logger.info(f'{len(pages)} pages, {len(titles)} to look up')
+
+        for i in range(0, len(titles), self.batch_size):
+            yield self.query_request(titles[i:i + self.batch_size])
+
+    def wiki_pages(self):
+        '''
+            Returns {title: (url, kind)} of the artist and song pages linked from the
+            participant data, each page once (the url and kind of its first link)
+        '''
+        pages = {}
+
+        with open(self.participants, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                for kind, column in (('artist', 'artistWikiUrl'), ('song', 'songWikiUrl')):
+                    url = row.get(column) or ''
+                    title = wiki_title(url)
+                    if title and title not in pages:
+                        pages[title] = (url, kind)
+
+        self.pages = pages
+        return pages
+
+    def query_request(self, titles, pending=None, continuation=None):
+        '''
+            The query request for a batch of titles. A continued request repeats the titles of
+            the batch with the continue parameters of the previous response, pending are the
+            titles that haven't been answered yet. Like the parse api requests of the contest
+            spiders, these are api calls and don't obey robots.txt (which disallows /w/)
+        '''
+        url = query_url(self.api_url, titles)
+        if continuation:
+            url += '&' + urlencode(continuation)
+
+        return scrapy.Request(
+            url,
+            callback=self.parse_query,
+            cb_kwargs={'titles': titles, 'pending': list(titles) if pending is None else pending},
+            meta={'dont_obey_robotstxt': True},
+            dont_filter=True
+        )
+
+    def parse_query(self, response, titles, pending):
+        data = response.json()
+
+        if 'error' in data:
+            self.logger.error(f"Error fetching {response.url}: {data['error'].get('info')}")
+            return
+
+        query = data.get('query', {})
+        resolved = resolved_titles(query)
+        pages = {page['title']: page for page in query.get('pages', [])}
+        unanswered = []
+
+        for title in pending:
+            page = pages.get(resolved.get(title, title))
+
+            # the api leaves out the content of some pages when a response gets too big, those
+            # are answered by the continued request
+            if page is None or not (page.get('missing') or page.get('invalid') or page.get('revisions')):
+                unanswered.append(title)
+                continue
+
+            metadata = page_metadata(page)
+            self.cache.put(title, metadata)
+            self.crawler.stats.inc_value('enrichment/fetched' if metadata['pageId'] else 'enrichment/missing')
+
+            url, kind = self.pages[title]
+            yield self.item(url, kind, metadata)
+
+        if unanswered and 'continue' in data:
+            self.crawler.stats.inc_value('enrichment/continued')
+            yield self.query_request(titles, unanswered, data['continue'])
+        elif unanswered:
+            self.logger.warning(f"No answer for {len(unanswered)} titles: {', '.join(unanswered)}")
+
+    def item(self, url, kind, metadata):
+        return EnrichmentItem(
+            url=url,
+            kind=kind,
+            title=metadata.get('title', ''),
+            pageId=metadata.get('pageId'),
+            birthYear=metadata.get('birthYear'),
+            origin=metadata.get('origin', ''),
+            genre=metadata.get('genre', ''),
+            length=metadata.get('length', ''),
+        )
+
+    def closed(self, reason):
+        self.cache.save()
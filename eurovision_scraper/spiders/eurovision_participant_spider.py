@@ -1,8 +1,9 @@
-import scrapy
-import time
-from eurovision_scraper.spiders.country_data import country_map
+from eurovision_scraper.items import ParticipantItem
+from eurovision_scraper.spiders.contest_spider import ContestSpider
+from eurovision_scraper.spiders.table_index import TableIndex
+from eurovision_scraper.parse_stats import record_table
 
-class EurovisionSpider(scrapy.Spider):
+class EurovisionSpider(ContestSpider):
     custom_settings = {
         'FEED_URI': 'eurovision_participant_data.csv',
         'FEED_EXPORT_FIELDS': ['year', 'country', 'broadcaster', 'artist', 'artistWikiUrl', 'song', 'songWikiUrl', 'language', 'songwriters', 'conductors'],
@@ -10,8 +11,6 @@ class EurovisionSpider(scrapy.Spider):
     }
 
     name = 'eurovision_participant'
-    # skipping 2020
-    start_urls = [f'https://en.wikipedia.org/wiki/Eurovision_Song_Contest_{year}' for year in list(range(1956, 2020)) + list(range(2021, 2025))]
 
     def parse(self, response):
         #time.sleep(1)  # 1 second delay between requests
@@ -20,7 +19,7 @@ class EurovisionSpider(scrapy.Spider):
             results = []
 
             # fetch the participant table 
-            table = response.xpath('//table[contains(@class, "wikitable") and contains(./caption, "Participants of the Eurovision Song Contest")]')
+            table = TableIndex.for_response(response).captioned("Participants of the Eurovision Song Contest", wikitable=True)
             
             # skip header row
             rows = table.xpath('.//tr[position() > 1]')  
@@ -42,20 +41,22 @@ class EurovisionSpider(scrapy.Spider):
                 songwriters = '|'.join(row.xpath('./td[5]//li//text()').getall()).strip()
                 conductors = row.xpath('./td[6]//text()').get(default='').strip()
 
-                result = {
-                    'year': year,
-                    'country': country_map.get(country, country),
-                    'broadcaster': broadcaster,
-                    'artist': artist,
-                    'artistWikiUrl': response.urljoin(artist_url) if artist_url else '',
-                    'song': song,
-                    'songWikiUrl': response.urljoin(song_url) if song_url else '',
-                    'language': language,
-                    'songwriters': songwriters,
-                    'conductors': conductors if not conductors.startswith('[') else ''
-                }
+                result = ParticipantItem(
+                    year=int(year),
+                    country=country,
+                    broadcaster=broadcaster,
+                    artist=artist,
+                    artistWikiUrl=response.urljoin(artist_url) if artist_url else '',
+                    song=song,
+                    songWikiUrl=response.urljoin(song_url) if song_url else '',
+                    language=language,
+                    songwriters=songwriters,
+                    conductors=conductors if not conductors.startswith('[') else ''
+                )
                 results.append(result)
 
+            record_table(response, self, 'participants', 'captioned' if table else None, len(results))
+
             return results
 
         except Exception as e:
@@ -1,35 +1,32 @@
-import scrapy
+import functools
+from scrapy.selector import SelectorList
+from eurovision_scraper.items import ResultItem
+from eurovision_scraper.spiders.contest_spider import ContestSpider
+from eurovision_scraper.spiders.table_index import TableIndex
+from eurovision_scraper.parse_stats import record_table
 
-class EurovisionResultsSpider(scrapy.Spider):
+class EurovisionResultsSpider(ContestSpider):
     name = 'eurovision_results'
     custom_settings = {
         'FEED_URI': 'eurovision_result_data.csv',
         'FEED_EXPORT_FIELDS': ['year', 'country', 'runningOrder', 'place'],
     }
 
-    # skipping 2020
-    start_urls = [f'https://en.wikipedia.org/wiki/Eurovision_Song_Contest_{year}' for year in list(range(1956, 2020)) + list(range(2021, 2025))]
-
     def parse(self, response):
         year = response.url.split('_')[-1]
+        table, locator = self.find_results_table(response, year)
+        yield from self.parse_table(response, year, table, locator)
 
-        if year == '2021':
-            # Find the table with the header containing "R/O" and no legend above it
-            table = response.xpath('//p[contains(., "closure of the voting window")]/following-sibling::table[1]')
-        else:
-            # Find the table with the caption starting with "Results of the Eurovision Song Contest"
-            table = response.xpath('//table[contains(./caption, "Results of the Eurovision Song Contest")]')
-
-            # The table name format changed after the 2003 articles
-            if not table:
-                table = response.xpath('//table[contains(./caption, "esults of the final of the Eurovision Song Contest")]')
-
-            # If the table is not found using the caption, try finding it using the legend div
-            if not table:
-                table = response.xpath('//div[@class="legend"][contains(., "Winner")]/following-sibling::table[1][.//th[contains(., "R/O")]]')
+    def watched_tables(self, response, year):
+        '''
+            Returns the (name, table, parse) of the results table for the watch mode, where
+            parse() returns the rows of the table
+        '''
+        table, locator = self.find_results_table(response, year)
+        return [('results', table, functools.partial(self.parse_table, response, year, table, locator))]
 
-            if not table:
-                table = response.xpath('//div[@class="legend"][contains(., "Winner")]/following-sibling::table[1]')
+    def parse_table(self, response, year, table, locator):
+        rows = 0
 
         # Extract data from each row of the table
         for row in table.xpath('.//tr[position() > 1]'):
@@ -46,11 +43,62 @@ class EurovisionResultsSpider(scrapy.Spider):
             else:
                 continue
 
-            place = row.xpath('./td[last()]//text()').get().strip()
+            # the places are blank until the results of a contest are published
+            place = (row.xpath('./td[last()]//text()').get() or '').strip()
+
+            rows += 1
+            yield ResultItem(
+                year=int(year),
+                country=country,
+                runningOrder=running_order,
+                place=place if place else ''
+            )
+
+        record_table(response, self, 'results', locator, rows)
+
+    def find_results_table(self, response, year):
+        '''
+            Returns the final results table of the article, along with the name of the locator
+            that found it (None if no table was found). The layout of these tables changed 
+            over the years, so each of the table locators below is tried in turn, starting 
+            with the one that found the table of this year in the last crawl (unless that's
+            the generic table_after_legend)
+        '''
+        index = TableIndex.for_response(response)
+
+        if year == '2021':
+            locators = ['table_after_voting_window']
+        else:
+            locators = ['table_by_caption', 'table_by_final_caption',
+                        'table_after_legend_with_running_order', 'table_after_legend']
+
+        # any table after the legend is only taken once the more specific locators missed,
+        # even if it found the table last time
+        for locator in self.locator_order(year, 'results', locators, generic=['table_after_legend']):
+            table = getattr(self, locator)(index)
+            if table:
+                self.locator_found(year, 'results', locator)
+                return table, locator
+
+        self.locator_found(year, 'results', None)
+        return SelectorList(), None
+
+    def table_after_voting_window(self, index):
+        # Find the table with the header containing "R/O" and no legend above it
+        return index.following('//p[contains(., "closure of the voting window")]')
+
+    def table_by_caption(self, index):
+        # Find the table with the caption starting with "Results of the Eurovision Song Contest"
+        return index.captioned("Results of the Eurovision Song Contest")
+
+    def table_by_final_caption(self, index):
+        # The table name format changed after the 2003 articles
+        return index.captioned("esults of the final of the Eurovision Song Contest")
+
+    def table_after_legend_with_running_order(self, index):
+        # If the table is not found using the caption, try finding it using the legend div
+        legend_tables = index.following('//div[@class="legend"][contains(., "Winner")]')
+        return SelectorList([t for t in legend_tables if t.xpath('.//th[contains(., "R/O")]')])
 
-            yield {
-                'year': year,
-                'country': country,
-                'runningOrder': running_order,
-                'place': place if place else ''
-            }
\ No newline at end of file
+    def table_after_legend(self, index):
+        return index.following('//div[@class="legend"][contains(., "Winner")]')
@@ -1,10 +1,30 @@
-import scrapy
-import time
-import json
-from eurovision_scraper.spiders.country_data import country_map
-
-
-class EurovisionSpider(scrapy.Spider):
+import functools
+from eurovision_scraper.items import VoteItem
+from eurovision_scraper.spiders.country_data import country_index
+from eurovision_scraper.spiders.contest_spider import ContestSpider
+from eurovision_scraper.spiders.table_index import TableIndex
+from eurovision_scraper.spiders.scoreboard import Scoreboard
+from eurovision_scraper.parse_stats import record_table
+
+# the voting tables of the articles from 2016 on: (table header, round, vote type)
+POST_2015_TABLES = [
+    ('Detailed jury voting results of the final', 'f', 'j'),
+    ('Detailed televoting results of the final', 'f', 'tv'),
+    # semi final 1
+    ('Detailed jury voting results of semi-final 1', 'sf1', 'j'),
+    ('Detailed televoting results of semi-final 1', 'sf1', 'tv'),
+    # semi final 2
+    ('Detailed jury voting results of semi-final 2', 'sf2', 'j'),
+    ('Detailed televoting results of semi-final 2', 'sf2', 'tv'),
+]
+
+# the headers of the pre-2016 voting tables that the headers of other tables start with too,
+# e.g. 'Detailed voting results' finds the semi-final tables of the articles from 2004 on.
+# these are only tried once the more specific headers found nothing (see LocatorCache.order)
+GENERIC_HEADERS = ['Detailed voting results']
+
+
+class EurovisionSpider(ContestSpider):
     '''
         Fetch all ESC voting data from the wiki article for each contest year and return it 
         the following CSV format:
@@ -19,11 +39,19 @@ class EurovisionSpider(scrapy.Spider):
     '''
     custom_settings = {
         'FEED_URI': 'eurovision_vote_data.csv',
-        'CONCURRENT_REQUESTS': 1
     }
     
     name = 'eurovision_vote'
-    start_urls = [f'https://en.wikipedia.org/wiki/Eurovision_Song_Contest_{year}' for year in list(range(1956, 2020)) + list(range(2021, 2025))] # note that we're skipping 2020
+
+    # the parser used to read the voting tables, either 'selector' or 'lxml' (see Scoreboard). 
+    # set with -a backend=lxml or the VOTE_PARSER_BACKEND setting
+    backend = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.backend = spider.backend or crawler.settings.get('VOTE_PARSER_BACKEND')
+        return spider
 
     def parse(self, response):
 
@@ -46,14 +74,8 @@ class EurovisionSpider(scrapy.Spider):
             else: 
                 raise Exception(f'Invalid year {year}')
                 
-            # deduplicate results 
-            unique_rows = set() 
-
-            for row in results:
-                key = tuple(row.values()) 
-                if key not in unique_rows:
-                    unique_rows.add(key)
-                    yield row
+            # duplicate rows are dropped by the DedupPipeline
+            yield from results
             
             #return results
                 
@@ -67,243 +89,164 @@ class EurovisionSpider(scrapy.Spider):
             those for previous years
         '''
         
-        jury_results = self.parse_table_post_2015(response, year, 'Detailed jury voting results of the final', 'f', 'j')
-        results.extend(jury_results)
-                
-        tele_results = self.parse_table_post_2015(response, year, 'Detailed televoting results of the final', 'f', 'tv')
-        results.extend(tele_results)
-                
-        # semi final 1
-        sf_1_jury_results = self.parse_table_post_2015(response, year, 'Detailed jury voting results of semi-final 1', 'sf1', 'j')
-        results.extend(sf_1_jury_results)
-                
-        sf_1_tele_results = self.parse_table_post_2015(response, year, 'Detailed televoting results of semi-final 1', 'sf1', 'tv')
-        results.extend(sf_1_tele_results)
-                
-        # semi final 2
-        sf_2_jury_results = self.parse_table_post_2015(response, year, 'Detailed jury voting results of semi-final 2', 'sf2', 'j')
-        results.extend(sf_2_jury_results)
-                
-        sf_2_tele_results = self.parse_table_post_2015(response, year, 'Detailed televoting results of semi-final 2', 'sf2', 'tv')
-        results.extend(sf_2_tele_results)
+        for table_header, round_name, vote_type in POST_2015_TABLES:
+            results.extend(self.parse_table_post_2015(response, year, table_header, round_name, vote_type))
+
+    def watched_tables(self, response, year):
+        '''
+            Returns the (name, table, parse) of each voting table for the watch mode, where
+            parse() returns the rows of the table. The articles before 2016 are watched as a 
+            single table
+        '''
+        if int(year) < 2016:
+            return [('votes', response.selector, lambda: list(self.parse(response)))]
 
+        index = TableIndex.for_response(response)
+        return [
+            (f'{round_name}/{vote_type}', index.find(table_header),
+             functools.partial(self.parse_table_post_2015, response, year, table_header, round_name, vote_type))
+            for table_header, round_name, vote_type in POST_2015_TABLES
+        ]
 
     def parse_table_post_2015(self, response, year, table_header, round_name, vote_type):
         '''
             Returns voting result data if available. First look for a table with the provided
             header name. If none is found, return empty array. Otherwise, parse the country-country
-            voting counts. 
-            
-            The header_ids_adjust is used to account for slight differences in how some tables are 
-            structured which can alter the index at which the required column headers (votingCountry) 
-            need to be selected 
+            voting counts from the table's scoreboard grid (see Scoreboard)
         '''  
         try:
             
-            # some index positioning variables used for parsing tables. these may need to be tweeked 
-            header_idx_adjust = -1
-            row_idx_adjust = 1
-            start_point_idx = 3
+            # the first row of these tables holds the score column headers (e.g. 'Total score'), 
+            # the voting countries are listed in the second row
+            header_row = 1
              
             # the voting results tables are labeled either via an overhead h2 or a table caption
-            table_selector = response.xpath(
-                f"//table[contains(@class, 'wikitable') and "
-                f"(./preceding::h2[contains(., '{table_header}')] or ./caption[contains(., '{table_header}')])]"
-            )
+            table_selector = TableIndex.for_response(response).find(table_header)
+            self.locator_found(year, f'{round_name}/{vote_type}', table_header if table_selector else None)
 
             if not table_selector:
-                print(f'No table found for {year} with name "{table_header}"')
+                self.logger.warning(f'No table found for {year} with name "{table_header}"')
+                record_table(response, self, f'{round_name}/{vote_type}', None, 0)
                 return
                 
-            table = table_selector[0]
-            rows = table.xpath(".//tr")
-            
-            header_row = rows[0 + row_idx_adjust]
-            data_rows = rows[1 + row_idx_adjust:]
+            scoreboard = self.scoreboard(table_selector[0])
+            rows = 0
                         
-            for row in data_rows:
+            for country, voting_country, point in scoreboard.votes(header_row, td_country=True):
                 
-                td_adjust, country = self.parse_country(row)
-
-                points = [td.xpath(".//text()").get().strip() if td.xpath(".//text()").get() else None
-                          for td in row.xpath(".//td")][start_point_idx + td_adjust:]                         
-
-                for i, point in enumerate(points, start = 2):
-                    if point is None or point == '':
-                        continue
-                
-                    voting_country = self.parse_voting_country(header_idx_adjust, header_row, country, i)
-                        
-                    if voting_country is None:
-                        continue
+                voting_country = self.parse_voting_country(voting_country, country)
                     
-                    yield {
-                        'year': year,
-                        'round': round_name,
-                        'country': country_map.get(country, country),
-                        'votingCountry': country_map.get(voting_country, voting_country),
-                        'voteType': vote_type, 
-                        'points': point.strip()
-                    }
+                if voting_country is None:
+                    continue
+                
+                rows += 1
+                yield VoteItem(
+                    year=int(year),
+                    round=round_name,
+                    country=country,
+                    votingCountry=voting_country,
+                    voteType=vote_type,
+                    points=int(point) if point.isdigit() else point
+                )
+
+            # the table header is the locator, as the fallbacks differ in the header they look for
+            record_table(response, self, f'{round_name}/{vote_type}', table_header, rows)
 
         except Exception as e:
             self.logger.error(f"Error in parse_table for {response.url}: {e}")
             return []
 
-    def parse_voting_country(self, header_idx_adjust, header_row, country, i):
+    def scoreboard(self, table):
         '''
-            Return the name of the voting country responsible for the points at the provided 
-            index, i. This is taken from the header_row with header_idx_adjust used to adjust 
-            the positioning as needed (some tables from certain years have slightly different 
-            formatting)
+            Returns the Scoreboard of the provided table Selector, built with the configured 
+            parser backend. The lxml backend reads the lxml tree that the selector wraps 
+            directly, so the page is still only parsed once
         '''
+        backend = self.backend or 'selector'
+        
+        if backend == 'lxml':
+            return Scoreboard.from_element(table.root)
         
-        voting_country_cell = header_row.xpath(f".//th[{i + header_idx_adjust}]")[0]                   
-        voting_country = voting_country_cell.xpath(".//text()").get().strip()
+        if backend == 'selector':
+            return Scoreboard.from_selector(table)
+            
+        raise Exception(f'Invalid parser backend {backend}')
+
+    def parse_voting_country(self, voting_country, country):
+        '''
+            Return the name of the voting country responsible for the points, or None if the 
+            column header isn't a voting country (some tables from certain years have slightly 
+            different formatting)
+        '''
 
         # we should skip this point value in two scenarios 
         # 1. if the voting_country has an html name or is called 'Total score', it's a total count, which we aren't tracking here 
         # 2. if the voting_country and country are the same, skip it (we don't want totals here)
-        #print(voting_country)
         if voting_country.startswith('.') or voting_country == 'Total score' or voting_country == country or ' score' in voting_country or voting_country == 'Jury':
             return None
 
-        # represent the 'Rest of the World' vote as the country pseudo-code 'row'
-        if voting_country == 'Rest of the World':
-            voting_country = 'row'
-            
+        # the 'Rest of the World' vote gets the country pseudo-code 'row' in the CountryPipeline
         return voting_country
-
-
-    def parse_country(self, row):
-        '''
-            Returns the name of the country being voted for within the provided row. If there's 
-            no th element, the country name is in the first td element instead. In that case set 
-            the td_adjust variable to 1 instead of 0 so that the points are extracted at the correct 
-            index 
-        '''
-        td_adjust = 0
-                
-        country_cell = row.xpath(".//th")
-                
-        if not country_cell:                    # If no <th> elements are found
-            country_cell = row.xpath(".//td")   # Get the <td> elements in the current row
-                    
-            if country_cell:                    # If any <td> elements are found
-                country_cell = country_cell[0]  # Take the first <td> element
-                td_adjust = 1
-        else:                                   # If <th> elements are found
-            country_cell = country_cell[0]      # Take the first <th> element
-                    
-        country = country_cell.xpath(".//text()").get().strip()
-                #print(country)
-                
-        if country == 'Contestants':
-            country_cell = row.xpath(".//td")[0]
-            td_adjust = 1
-            country = country_cell.xpath(".//text()").get().strip()
-            
-        if country.isnumeric():
-            td_adjust = 1
-            
-        numeric_shift = False
-        
-        while country == 'Contestants' or country.isnumeric():
-            numeric_shift = True
-            country_cell = row.xpath(".//th")[td_adjust]
-            td_adjust += 1
-            country = country_cell.xpath(".//text()").get().strip()
-
-        
-        if (numeric_shift):
-            td_adjust -= 2
-                     
-        return td_adjust, country
     
     
     
-    def parse_table_pre_2016(self, response, year, table_header, round_name, vote_type, header_idx_adjust):
+    def parse_table_pre_2016(self, response, year, table_headers, round_name, vote_type, expected=True):
         '''
             Returns voting result data if available. First look for a table with the provided
-            header name. If none is found, return empty array. Otherwise, parse the country-country
-            voting counts. 
-            
-            The header_ids_adjust is used to account for slight differences in how some tables are 
-            structured which can alter the index at which the required column headers (votingCountry) 
-            need to be selected 
+            header name (or the first of a list of fallback header names that finds a table, 
+            see TableIndex.resolve). If none is found, return empty array. Otherwise, parse the 
+            country-country voting counts from the table's scoreboard grid (see Scoreboard).
+            A missing table is only logged as a warning if the article is expected to have one
         '''  
         try:
-            row_idx_adjust = 0
+            # the voting countries are listed in the first row of these tables
+            header_row = 0
+
+            if isinstance(table_headers, str):
+                table_headers = [table_headers]
                 
-            # the voting results tables are labeled either via an overhead h2 or a table caption
-            table_selector = response.xpath(
-                f"//table[contains(@class, 'wikitable') and "
-                f"(./preceding::h2[contains(., '{table_header}')] or ./caption[contains(., '{table_header}')])]"
+            # the voting results tables are labeled either via an overhead h2 or a table caption.
+            # the header that found the table in the last crawl is tried first, unless it's a
+            # generic one
+            table_header, table_selector = TableIndex.for_response(response).resolve(
+                self.locator_order(year, f'{round_name}/{vote_type}', table_headers, GENERIC_HEADERS)
             )
+            self.locator_found(year, f'{round_name}/{vote_type}', table_header)
 
             if not table_selector:
-                print(f'No table found for {year} with name "{table_header}"')
+                names = '" or "'.join(table_headers)
+                log = self.logger.warning if expected else self.logger.debug
+                log(f'No table found for {year} with name "{names}"')
+                record_table(response, self, f'{round_name}/{vote_type}', None, 0)
                 return
 
-            table = table_selector[0]
-            rows = table.xpath(".//tr")
-            
-            header_row = rows[0 + row_idx_adjust]
-            data_rows = rows[1 + row_idx_adjust:]
+            scoreboard = self.scoreboard(table_selector[0])
+            rows = 0
 
-            for row in data_rows:
-                
-                if not row.xpath(".//th"):
-                    print(row)
+            for country, voting_country, point in scoreboard.votes(header_row):
+
+                # we should skip this point value in two scenarios 
+                # 1. if the voting_country has an html name or is called 'Total score', it's a total count, which we aren't tracking here 
+                # 2. if the voting_country and country are the same, skip it (we don't want totals here)
+                if voting_country.startswith('.') or voting_country == 'Total score' or voting_country == country or ' score' in voting_country or country_index.code(voting_country) is None:
                     continue
-                
-                country_cell = row.xpath(".//th")[0]
-                country = country_cell.xpath(".//text()").get().strip()
 
-                if country == 'Contestants':
-                    country_cell = row.xpath(".//th")[1]
-                    country = country_cell.xpath(".//text()").get().strip()
-                    #print(country)
+                rows += 1
+                yield VoteItem(
+                    year=int(year),
+                    round=round_name,
+                    country=country,
+                    votingCountry=voting_country,
+                    voteType=vote_type,
+                    points=int(point) if point.isdigit() else point
+                )
 
-                points = [td.xpath(".//text()").get().strip() if td.xpath(".//text()").get() else None
-                            for td in row.xpath(".//td")]                          
-
-                for i, point in enumerate(points, start=2):
-                    if point is None or point == '':
-                        continue
-                
-                    voting_country_cell = header_row.xpath(f".//th[{i + header_idx_adjust}]")
-                    
-                    if not voting_country_cell:
-                        voting_country_cell = header_row.xpath(f".//td[{i + header_idx_adjust}]")
-                    
-                    if not voting_country_cell:
-                        print('skipping ' + country)
-                        continue; 
-                    
-                    voting_country_cell = voting_country_cell[0]
-                    
-                    voting_country = voting_country_cell.xpath(".//text()").get().strip()
-
-                    # we should skip this point value in two scenarios 
-                    # 1. if the voting_country has an html name or is called 'Total score', it's a total count, which we aren't tracking here 
-                    # 2. if the voting_country and country are the same, skip it (we don't want totals here)
-                    if voting_country.startswith('.') or voting_country == 'Total score' or voting_country == country or ' score' in voting_country or country_map.get(voting_country) == None:
-                        continue
-
-                    yield {
-                        'year': year,
-                        'round': round_name,
-                        'country': country_map.get(country, country),
-                        'votingCountry': country_map.get(voting_country, voting_country),
-                        'voteType': vote_type, 
-                        'points': point.strip()
-                    }
+            # the table header is the locator, as the fallbacks differ in the header they look for
+            record_table(response, self, f'{round_name}/{vote_type}', table_header, rows)
 
         except Exception as e:
             self.logger.error(f"Error in parse_table for {response.url}: {e}")
             raise
-            return []
         
     def get_pre_2016_results(self, response, year, results):
         '''
@@ -311,39 +254,44 @@ class EurovisionSpider(scrapy.Spider):
             can be displayed in each wiki article, which is reflected below. 
         '''    
          
-        # first try to get the final results from pages where there are also semi-finals
-        final_results = self.parse_table_pre_2016(response, year, 'Detailed voting results of the final', 'f', 't', -1)
+        # first try to get the final results from pages where there are also semi-finals. if 
+        # there is no such table (e.g. before 2004), get the final voting results from the more 
+        # generically titled results table. only the first table found is parsed: the generic 
+        # header also matches the semi-final tables of the later years
+        final_results = self.parse_table_pre_2016(
+            response, year, ['Detailed voting results of the final', 'Detailed voting results'], 'f', 't'
+        )
         results.extend(final_results)
 
-        # if there were no final_results from a semi-final year (2004+), get the final voting results from 
-        # the more generically titled results table
-        if not final_results or not list(final_results):
-            legacy_final_results = self.parse_table_pre_2016(response, year, 'Detailed voting results', 'f', 't', 0)
-            results.extend(legacy_final_results)
-
         # try to get semi-final results (these only exist from 2004 on)
-        semi_final1 = self.parse_table_pre_2016(response, year, 'Detailed voting results of semi-final 1', 'sf1', 't', -1)
-        results.extend(semi_final1)
+        index = TableIndex.for_response(response)
+        semi_final_headers = ['Detailed voting results of semi-final 1', 'Detailed voting results of semi-final 2']
 
-        semi_final2 = self.parse_table_pre_2016(response, year, 'Detailed voting results of semi-final 2', 'sf2', 't', -1)
-        results.extend(semi_final2)
+        if any(index.find(header) for header in semi_final_headers):
+            semi_final1 = self.parse_table_pre_2016(response, year, semi_final_headers[0], 'sf1', 't')
+            results.extend(semi_final1)
+
+            semi_final2 = self.parse_table_pre_2016(response, year, semi_final_headers[1], 'sf2', 't')
+            results.extend(semi_final2)
 
-        # if there were no semi-final 1 and 2 results, try getting semi-final results 
+        # if there were no semi-final 1 and 2 tables, try getting semi-final results 
         # using the more generic table label. This captures years where there was 
-        # only one semi final (e.g. 2004)
-        if not list(semi_final1) and not list(semi_final2):
-            semi_final = self.parse_table_pre_2016(response, year, 'Detailed voting results of the semi-final', 'sf', 't', -1)
+        # only one semi final (e.g. 2004). the articles before 2004 have no semi-final
+        else:
+            semi_final = self.parse_table_pre_2016(
+                response, year, 'Detailed voting results of the semi-final', 'sf', 't', expected=int(year) >= 2004
+            )
             results.extend(semi_final)
             
             
     def get_2013_results(self, response, year, results):
-        final_results = self.parse_table_pre_2016(response, year, 'Final voting results', 'f', 't', 0)
+        final_results = self.parse_table_pre_2016(response, year, 'Final voting results', 'f', 't')
         results.extend(final_results)
             
-        semi_final1 = self.parse_table_pre_2016(response, year, 'Semi-final 1 voting results', 'sf1', 't', 0)
+        semi_final1 = self.parse_table_pre_2016(response, year, 'Semi-final 1 voting results', 'sf1', 't')
         results.extend(semi_final1)
 
-        semi_final2 = self.parse_table_pre_2016(response, year, 'Semi-final 2 voting results', 'sf2', 't', 0)
+        semi_final2 = self.parse_table_pre_2016(response, year, 'Semi-final 2 voting results', 'sf2', 't')
         results.extend(semi_final2)
             #raise
 
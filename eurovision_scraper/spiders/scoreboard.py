@@ -0,0 +1,177 @@
+from collections import namedtuple
+
+from lxml import etree
+
+# a table cell placed in the scoreboard grid. row and col are the position of the cell's top
+# left corner, so a cell that spans several rows or columns can be told apart from the cells
+# that start at a given position. text is the first text node in the cell (or None)
+Cell = namedtuple('Cell', ['tag', 'text', 'row', 'col'])
+
+# precompiled queries for the lxml backend (see Scoreboard.from_element)
+ROWS_XPATH = etree.XPath('.//tr')
+CELLS_XPATH = etree.XPath('./th | ./td')
+
+# the largest span that is honoured, as in the html spec
+MAX_COLSPAN = 1000
+MAX_ROWSPAN = 65534
+
+
+def span(value, limit):
+    try:
+        return min(max(int(value), 1), limit)
+    except (TypeError, ValueError):
+        return 1
+
+
+def text_of(cell):
+    return cell.text.strip() if cell is not None and cell.text else ''
+
+
+class Scoreboard:
+    '''
+        A voting results table expanded into a dense 2D grid, so that the points a country
+        received from each voting country can be read by indexing instead of per cell lookups.
+
+        Cells spanning several rows or columns (e.g. the 'Contestants' row header or the
+        blank top left corner) fill every grid position they cover. This keeps the points in a
+        row aligned with the voting country in the header row above them, whatever the number
+        of leading label or score columns of a particular table.
+    '''
+
+    def __init__(self, rows):
+        '''
+            rows is a list of table rows, each a list of (tag, text, rowspan, colspan) tuples
+        '''
+        self.grid = []
+
+        for r, cells in enumerate(rows):
+            while len(self.grid) <= r:
+                self.grid.append([])
+
+            c = 0
+            for tag, text, rowspan, colspan in cells:
+                line = self.grid[r]
+
+                # skip positions that are covered by cells spanning from previous rows
+                while c < len(line) and line[c] is not None:
+                    c += 1
+
+                cell = Cell(tag, text, r, c)
+                rowspan = min(span(rowspan, MAX_ROWSPAN), len(rows) - r)
+                colspan = span(colspan, MAX_COLSPAN)
+
+                for i in range(r, r + rowspan):
+                    while len(self.grid) <= i:
+                        self.grid.append([])
+
+                    target = self.grid[i]
+                    if len(target) < c + colspan:
+                        target.extend([None] * (c + colspan - len(target)))
+
+                    for j in range(c, c + colspan):
+                        if target[j] is None:
+                            target[j] = cell
+
+                c += colspan
+
+        self.width = max((len(line) for line in self.grid), default=0)
+
+        for line in self.grid:
+            line.extend([None] * (self.width - len(line)))
+
+    @classmethod
+    def from_selector(cls, table):
+        '''
+            Build the scoreboard of a table Selector. Each row is read with a single xpath
+            evaluation and each cell with one more for its text
+        '''
+        return cls([
+            [(cell.root.tag, cell.xpath('.//text()').get(), cell.attrib.get('rowspan'), cell.attrib.get('colspan'))
+             for cell in row.xpath('./th | ./td')]
+            for row in table.xpath('.//tr')
+        ])
+
+    @classmethod
+    def from_element(cls, table):
+        '''
+            Build the scoreboard of an lxml table element (e.g. Selector.root). The rows and
+            cells are walked directly, without wrapping each cell in a Selector, and the first
+            text node of a cell is read from itertext(). This produces the same grid as
+            from_selector
+        '''
+        return cls([
+            [(cell.tag, next(cell.itertext(), None), cell.get('rowspan'), cell.get('colspan'))
+             for cell in CELLS_XPATH(row)]
+            for row in ROWS_XPATH(table)
+        ])
+
+    def voting_countries(self, header_row):
+        '''
+            Returns (column, name) pairs for every cell that starts in the header row. Columns
+            covered by cells spanning down from a previous row (e.g. 'Total score') are excluded
+        '''
+        if header_row >= len(self.grid):
+            return []
+
+        return [(c, text_of(cell)) for c, cell in enumerate(self.grid[header_row])
+                if cell is not None and cell.row == header_row and cell.col == c and text_of(cell)]
+
+    def country_column(self, header_row, td_country=False):
+        '''
+            Returns the column holding the name of the country being voted for. This is the first
+            th cell in a row that isn't the 'Contestants' label or a running order number. If
+            td_country is set, the first td is used for tables without any row headers
+        '''
+        for line in self.grid[header_row + 1:]:
+            th_column = td_column = None
+
+            for c, cell in enumerate(line):
+                text = text_of(cell)
+                if cell is None or not text or text == 'Contestants' or text.isnumeric():
+                    continue
+
+                if cell.tag == 'th' and th_column is None:
+                    th_column = c
+                elif cell.tag == 'td' and td_column is None:
+                    td_column = c
+
+            if th_column is not None:
+                return th_column
+            if td_country and td_column is not None:
+                return td_column
+
+        return None
+
+    def votes(self, header_row, td_country=False):
+        '''
+            Yields a (country, voting_country, points) tuple for every non-empty points cell in
+            the rows below the header row
+        '''
+        country_column = self.country_column(header_row, td_country)
+
+        if country_column is None:
+            return
+
+        voting_countries = [(c, name) for c, name in self.voting_countries(header_row) if c > country_column]
+
+        for r in range(header_row + 1, len(self.grid)):
+            line = self.grid[r]
+            country_cell = line[country_column]
+
+            # skip rows without a country of their own
+            if country_cell is None or country_cell.row != r or (country_cell.tag != 'th' and not td_country):
+                continue
+
+            country = text_of(country_cell)
+            if not country:
+                continue
+
+            for c, voting_country in voting_countries:
+                cell = line[c]
+
+                if cell is None or cell.tag != 'td' or cell.row != r or cell.col != c:
+                    continue
+
+                points = text_of(cell)
+                if points:
+                    yield country, voting_country, points
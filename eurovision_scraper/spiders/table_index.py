@@ -0,0 +1,119 @@
+import weakref
+
+from scrapy.selector import SelectorList
+
+from eurovision_scraper.parse_stats import selector_for
+
+# indexes are built once per response and shared by every spider that parses it
+_indexes = weakref.WeakKeyDictionary()
+
+
+class TableIndex:
+    '''
+        Index of the tables in a contest article, built with a single pass over the document.
+
+        Looking a table up by the h2 heading above it used to be done with a
+        `./preceding::h2[...]` predicate, which scans the start of the document for every
+        table in it. Here each table records how many h2 headings precede it instead, so that
+        a heading or caption lookup is a scan over the (few dozen) tables of the page and
+        every lookup is memoised.
+    '''
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.headings = []
+        self.tables = []
+        self.cache = {}
+
+        # walk the lxml tree directly, only the matched tables are wrapped in selectors
+        for element in selector.root.iter('h2', 'table'):
+            if element.tag == 'h2':
+                self.headings.append(''.join(element.itertext()))
+                continue
+
+            self.tables.append({
+                'element': element,
+                'wikitable': 'wikitable' in (element.get('class') or ''),
+                'captions': [''.join(caption.itertext()) for caption in element.iterchildren('caption')],
+                'headings_before': len(self.headings)
+            })
+
+    @classmethod
+    def for_response(cls, response):
+        index = _indexes.get(response)
+
+        if index is None:
+            index = _indexes[response] = cls(selector_for(response))
+
+        return index
+
+    def find(self, header):
+        '''
+            Returns a SelectorList with the first wikitable that is either preceded by an h2
+            heading containing the provided header or has a caption containing it. This is
+            equivalent to
+
+            //table[contains(@class, 'wikitable') and
+                    (./preceding::h2[contains(., header)] or ./caption[contains(., header)])][1]
+        '''
+        key = ('find', header)
+
+        if key not in self.cache:
+            # every table after the first matching heading is preceded by it
+            first_heading = next((i for i, text in enumerate(self.headings) if header in text), None)
+
+            self.cache[key] = self.selectors(
+                [table for table in self.tables
+                 if table['wikitable'] and (
+                     (first_heading is not None and table['headings_before'] > first_heading) or
+                     any(header in caption for caption in table['captions'])
+                 )][:1]
+            )
+
+        return self.cache[key]
+
+    def resolve(self, headers):
+        '''
+            Returns a (header, SelectorList) tuple for the first of the candidate headers that
+            finds a table (see find), or (None, an empty SelectorList) if none of them do. The
+            candidates after the first match are never looked up
+        '''
+        for header in headers:
+            table = self.find(header)
+            if table:
+                return header, table
+
+        return None, SelectorList()
+
+    def captioned(self, caption, wikitable=False):
+        '''
+            Returns a SelectorList with every table (or every wikitable) whose caption contains
+            the provided text, e.g. //table[contains(./caption, caption)]
+        '''
+        key = ('captioned', caption, wikitable)
+
+        if key not in self.cache:
+            self.cache[key] = self.selectors(
+                [table for table in self.tables
+                 if (table['wikitable'] or not wikitable) and
+                 any(caption in text for text in table['captions'])]
+            )
+
+        return self.cache[key]
+
+    def following(self, marker):
+        '''
+            Returns a SelectorList with the first table following each element matched by the
+            provided xpath on the same level, e.g. the table below a legend or a paragraph
+        '''
+        key = ('following', marker)
+
+        if key not in self.cache:
+            self.cache[key] = self.selector.xpath(f'{marker}/following-sibling::table[1]')
+
+        return self.cache[key]
+
+    def selectors(self, tables):
+        return SelectorList(
+            [self.selector.__class__(root=table['element'], type='html') for table in tables]
+        )
@@ -0,0 +1,133 @@
+import time
+from email.utils import parsedate_to_datetime
+
+
+def retry_after(value, now=None):
+    '''
+        Returns the number of seconds to wait from a Retry-After header value, which is either
+        a number of seconds or an http date, or None if the value can't be parsed
+    '''
+    if not value:
+        return None
+
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, date.timestamp() - (time.time() if now is None else now))
+
+
+class TokenBucket:
+    '''
+        Paces the requests sent to a single host. Tokens are added at `rate` per second, up to
+        `burst` tokens, and every request takes one. A request that finds the bucket empty
+        reserves the next token and waits until it is added, so concurrent requests are spread
+        out evenly rather than all waiting for the same token.
+
+        The rate follows the latency of the responses: it moves towards the rate at which
+        `target_concurrency` requests would be in flight, within [min_rate, max_rate], rising
+        by at most `max_increase` per response. Throttling responses (429/503) cut the rate by
+        the backoff factor and pause the bucket until the server's Retry-After has passed.
+
+        The rate at which the server last throttled is kept as a ceiling just below it, so the
+        rate doesn't climb straight back into the server's limit. The ceiling is raised a
+        little with every successful response, in case the server's capacity grows again.
+    '''
+
+    # the share of the throttled rate that the ceiling is set to, and how much the ceiling
+    # rises with each successful response
+    ceiling_margin = 0.8
+    ceiling_growth = 1.005
+
+    def __init__(self, rate, burst=1, min_rate=0.1, max_rate=8.0, target_concurrency=2.0,
+                 backoff=0.5, max_increase=1.25, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_concurrency = target_concurrency
+        self.backoff = backoff
+        self.max_increase = max_increase
+        self.clock = clock
+
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.ceiling = max_rate
+
+    def reserve(self):
+        '''
+            Take a token and return the number of seconds to wait before using it
+        '''
+        now = self.clock()
+
+        # no tokens are added while the bucket is paused
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+        self.tokens -= 1
+        ready = self.updated + max(0.0, -self.tokens) / self.rate
+
+        return max(0.0, ready - now)
+
+    def pause_remaining(self):
+        '''
+            Returns the number of seconds left until the bucket is no longer paused
+        '''
+        return max(0.0, self.paused_until - self.clock())
+
+    def pause(self, seconds):
+        '''
+            Stop handing out tokens for the provided number of seconds. Requests that already
+            reserved a token wait for the pause to end too (see pause_remaining)
+        '''
+        until = self.clock() + seconds
+        self.paused_until = max(self.paused_until, until)
+        self.updated = max(self.updated, self.paused_until)
+        self.tokens = min(self.tokens, 0.0)
+
+    def throttled(self):
+        self.ceiling = max(self.min_rate, min(self.ceiling, self.rate * self.ceiling_margin))
+        self.rate = max(self.min_rate, self.rate * self.backoff)
+
+    def observe(self, latency, ok=True):
+        '''
+            Adjust the rate to the latency of a response. Failed responses can only slow the
+            rate down, a fast error page shouldn't speed up the crawl
+        '''
+        if ok:
+            self.ceiling = min(self.max_rate, self.ceiling * self.ceiling_growth)
+
+        target = self.target_concurrency / max(latency, 0.001)
+        rate = min(self.ceiling, max(self.min_rate, (self.rate + target) / 2))
+
+        # slow down straight away, but speed up gradually (e.g. after a throttling response)
+        if rate > self.rate:
+            if not ok:
+                return
+            rate = min(rate, self.rate * self.max_increase)
+
+        self.rate = rate
+
+
+class ThrottleState:
+    '''
+        The token bucket of each host and the number of requests sent so far. Every crawl has
+        its own, unless THROTTLE_SHARED is set: then all the crawls running in the process
+        share a single state (see run.py), so the hosts are paced and the request budget is
+        counted across all of them
+    '''
+
+    def __init__(self):
+        self.buckets = {}
+        self.sent = 0
@@ -0,0 +1,212 @@
+'''
+    Checks the vote, result and participant feeds against each other before they're
+    published, and prints a report of the problems found in each year.
+
+    e.g.
+        python -m eurovision_scraper.validate
+        python -m eurovision_scraper.validate -v --votes shard/eurovision_vote_data.csv
+
+    The checks, each run over whole arrays rather than row by row:
+
+    duplicates          rows with the same key (see pipelines.DEDUP_KEYS) in any of the feeds
+    unknown countries   countries that have no code in the country index (see CountryIndex)
+    point sets          voters whose points in a round aren't 1-8, 10 and 12, once each (from
+                        1975, when that scoring was introduced), for each vote type
+    ranking             countries of the final that are placed above a country with more
+                        points, and countries that received points in the final but have no
+                        place in the results
+
+    The exit status is 1 if any problem was found. Needs numpy (pip install numpy).
+'''
+import argparse
+import sys
+import time
+
+# numpy is only needed for the validation
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from eurovision_scraper.merge import read_rows
+from eurovision_scraper.spiders.country_data import country_index
+from eurovision_scraper.vote_tensor import VoteTensor
+
+CHECKS = ['duplicates', 'unknown countries', 'point sets', 'ranking']
+
+# the points each voter gives in a round, from 1975 on
+SCORING_POINTS = (1, 2, 3, 4, 5, 6, 7, 8, 10, 12)
+SCORING_FROM = 1975
+
+# the codes of the country index, including 'row' for the rest of the world televote
+KNOWN_CODES = sorted(country_index.codes)
+
+
+def load_columns(path):
+    '''
+        Returns {field: array of strings} of a csv or JSON lines feed
+    '''
+    rows = read_rows(path)
+    fields = next(rows)
+    table = np.array(list(rows), dtype=str).reshape(-1, len(fields))
+    return {field: table[:, i] for i, field in enumerate(fields)}
+
+
+class Report:
+    '''
+        The problems found by each check, by year
+    '''
+
+    def __init__(self):
+        self.years = {}
+
+    def add(self, year, check, message):
+        self.years.setdefault(str(year), {}).setdefault(check, []).append(message)
+
+    def count(self):
+        return sum(len(messages) for checks in self.years.values() for messages in checks.values())
+
+    def print(self, verbose=False, file=sys.stdout):
+        if not self.years:
+            print('No problems found', file=file)
+            return
+
+        print(f"{'year':<6}" + ''.join(f'{check:>19}' for check in CHECKS), file=file)
+        years = sorted(self.years, key=lambda year: (0, int(year)) if year.isdigit() else (1, year))
+
+        for year in years:
+            checks = self.years[year]
+            print(f'{year:<6}' + ''.join(f'{len(checks.get(check, [])):>19}' for check in CHECKS), file=file)
+
+        if verbose:
+            for year in years:
+                for check in CHECKS:
+                    for message in self.years[year].get(check, []):
+                        print(f'{year} {check}: {message}', file=file)
+
+
+def check_duplicates(report, feed, columns, key_fields):
+    keys, counts = np.unique(np.stack([columns[field] for field in key_fields], axis=1), axis=0, return_counts=True)
+
+    for key, count in zip(keys[counts > 1], counts[counts > 1]):
+        report.add(key[0], 'duplicates', f"{count} {feed} rows for {', '.join(key)}")
+
+
+def check_countries(report, feed, columns, fields, known):
+    for field in fields:
+        unknown = ~np.isin(columns[field], known)
+        for year, country in np.unique(np.stack([columns['year'][unknown], columns[field][unknown]], axis=1), axis=0):
+            report.add(year, 'unknown countries', f'{feed} {field} {country!r}')
+
+
+def check_point_sets(report, votes):
+    '''
+        Every voter that voted in a round gives each of SCORING_POINTS exactly once
+    '''
+    years = np.array(votes.years)
+    scored = years >= SCORING_FROM
+    points = votes.points[scored]
+
+    counts = np.stack([(points == value).sum(axis=-1) for value in SCORING_POINTS], axis=-1)
+    valid = (counts == 1).all(axis=-1) & ((points > 0).sum(axis=-1) == len(SCORING_POINTS))
+    invalid = votes.voted[scored].any(axis=-1) & ~valid
+
+    for y, r, v, c in zip(*np.nonzero(invalid)):
+        given = points[y, r, v, c]
+        report.add(
+            years[scored][y], 'point sets',
+            f'{votes.countries[c]} gave {sorted(int(p) for p in given[given > 0])} '
+            f'in {votes.rounds[r]}/{votes.vote_types[v]}'
+        )
+
+
+def check_ranking(report, votes, results):
+    '''
+        The places of the final follow the points received in the final (ties may be placed
+        either way)
+    '''
+    if 'f' not in votes.round_index:
+        return
+
+    received = votes.awarded[:, votes.round_index['f']].sum(axis=-2)
+
+    year_index = np.array([votes.year_index.get(int(y), -1) if y.isdigit() else -1 for y in results['year']], dtype=np.intp)
+    country_index = np.array([votes.country_index.get(code, -1) for code in results['country']], dtype=np.intp)
+    numeric = np.char.isdigit(results['place'])
+    place = np.where(numeric, results['place'], '0').astype(int)
+
+    keep = (year_index >= 0) & (country_index >= 0) & numeric
+    y, c, p = year_index[keep], country_index[keep], place[keep]
+    order = np.lexsort((p, y))
+    y, c, p = y[order], c[order], p[order]
+    points = received[y, c]
+
+    # a country placed below the one before it, with more points
+    inverted = np.flatnonzero((y[1:] == y[:-1]) & (p[1:] > p[:-1]) & (points[1:] > points[:-1]))
+    for i in inverted:
+        report.add(
+            votes.years[y[i]], 'ranking',
+            f'{votes.countries[c[i + 1]]} placed {p[i + 1]} with {points[i + 1]} points, '
+            f'below {votes.countries[c[i]]} placed {p[i]} with {points[i]} points'
+        )
+
+    # only the rows of known countries are placed: a row of an unknown country mustn't be
+    # written to (and clear) the cell of another country
+    mask = (year_index >= 0) & (country_index >= 0)
+    placed = np.zeros(received.shape, dtype=bool)
+    placed[year_index[mask], country_index[mask]] = True
+    has_results = np.zeros(len(votes.years), dtype=bool)
+    has_results[year_index[year_index >= 0]] = True
+
+    for y, c in zip(*np.nonzero((received > 0) & ~placed & has_results[:, None])):
+        report.add(votes.years[y], 'ranking', f'{votes.countries[c]} received {received[y, c]} points in the final but has no place')
+
+
+def validate(votes_path, results_path, participants_path):
+    if np is None:
+        raise ImportError('numpy is needed for the validation (pip install numpy)')
+
+    report = Report()
+    votes = load_columns(votes_path)
+    results = load_columns(results_path)
+    participants = load_columns(participants_path)
+
+    check_duplicates(report, 'vote', votes, ['year', 'round', 'country', 'votingCountry', 'voteType'])
+    check_duplicates(report, 'result', results, ['year', 'country', 'runningOrder'])
+    check_duplicates(report, 'participant', participants, ['year', 'country'])
+
+    # results feeds written before the CountryPipeline hold country names rather than codes
+    results['country'] = np.array([country_index.normalise(name) or name for name in results['country']], dtype=str)
+
+    check_countries(report, 'vote', votes, ['country', 'votingCountry'], KNOWN_CODES)
+    check_countries(report, 'participant', participants, ['country'], KNOWN_CODES)
+    check_countries(report, 'result', results, ['country'], KNOWN_CODES)
+
+    tensor = VoteTensor.from_rows(
+        dict(zip(votes, row)) for row in zip(*votes.values())
+    )
+    check_point_sets(report, tensor)
+    check_ranking(report, tensor, results)
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the vote, result and participant feeds against each other')
+    parser.add_argument('--votes', default='eurovision_vote_data.csv')
+    parser.add_argument('--results', default='eurovision_result_data.csv')
+    parser.add_argument('--participants', default='eurovision_participant_data.csv')
+    parser.add_argument('-v', '--verbose', action='store_true', help='list every problem')
+    options = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    report = validate(options.votes, options.results, options.participants)
+    elapsed = time.perf_counter() - start
+
+    report.print(options.verbose)
+    print(f'\n{report.count()} problems found in {elapsed:.2f}s', file=sys.stderr)
+    return 1 if report.count() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
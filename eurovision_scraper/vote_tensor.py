@@ -0,0 +1,297 @@
+'''
+    The voting data as a dense NumPy tensor, for analytics that would otherwise loop over the
+    rows of eurovision_vote_data.csv again and again.
+
+    points[year, round, voteType, voter, recipient] holds the points that the voting country
+    gave to the country, and voted[...] whether that vote was in the data at all (so that a
+    vote of 0 points can be told apart from no vote). Countries are indexed by their code in
+    country_map (plus any other code found in the data, e.g. 'row' for the rest of the world).
+
+    e.g.
+        votes = VoteTensor.load('eurovision_vote_data.csv')
+        votes.ranking(1974)
+        votes.head_to_head('gr', 'cy')
+        matrix, countries = votes.bloc_matrix(years=range(2000, 2020), average=True)
+
+    The first load parses the csv and saves the tensor to a sidecar directory next to it
+    (eurovision_vote_data.csv.tensor/). Later loads memory map the sidecar instead, until the
+    csv changes.
+
+    Needs numpy (pip install numpy).
+'''
+import csv
+import json
+import os
+
+# numpy is only needed for the vote tensor
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from eurovision_scraper.spiders.country_data import country_map
+
+# the known values of each axis, in order. values that aren't known are added after them
+ROUNDS = ['f', 'sf', 'sf1', 'sf2', 'sf3']
+VOTE_TYPES = ['t', 'j', 'tv']
+
+SIDECAR_VERSION = 1
+
+
+class VoteTensor:
+
+    def __init__(self, points, voted, years, rounds, vote_types, countries):
+        self.points = points
+        self.voted = voted
+        self.years = list(years)
+        self.rounds = list(rounds)
+        self.vote_types = list(vote_types)
+        self.countries = list(countries)
+
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+        self.round_index = {round: i for i, round in enumerate(self.rounds)}
+        self.vote_type_index = {vote_type: i for i, vote_type in enumerate(self.vote_types)}
+        self.country_index = {country: i for i, country in enumerate(self.countries)}
+        self._awarded = None
+
+    @classmethod
+    def load(cls, path='eurovision_vote_data.csv', sidecar=None, cache=True):
+        '''
+            Load the votes of a csv file, from its sidecar if that's up to date. With
+            cache=False the csv is always parsed and no sidecar is written
+        '''
+        if np is None:
+            raise ImportError('numpy is needed for the vote tensor (pip install numpy)')
+
+        sidecar = sidecar or path + '.tensor'
+
+        if cache:
+            tensor = cls.load_sidecar(sidecar, source_stamp(path))
+            if tensor is not None:
+                return tensor
+
+        tensor = cls.from_csv(path)
+
+        if cache:
+            tensor.save_sidecar(sidecar, source_stamp(path))
+
+        return tensor
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            # a csv that was appended to by several crawls repeats its header row
+            rows = [row for row in csv.DictReader(f) if row['year'].isdigit()]
+
+        return cls.from_rows(rows)
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''
+            Build the tensor from vote rows (dicts with the csv columns)
+        '''
+        if np is None:
+            raise ImportError('numpy is needed for the vote tensor (pip install numpy)')
+
+        rows = [row for row in rows if str(row['points']).strip().isdigit()]
+
+        years = sorted({int(row['year']) for row in rows})
+        rounds = axis_values(ROUNDS, (row['round'] for row in rows))
+        vote_types = axis_values(VOTE_TYPES, (row['voteType'] for row in rows))
+        countries = axis_values(
+            sorted(set(country_map.values())),
+            (code for row in rows for code in (row['votingCountry'], row['country']))
+        )
+
+        shape = (len(years), len(rounds), len(vote_types), len(countries), len(countries))
+        points = np.zeros(shape, dtype=np.int16)
+        voted = np.zeros(shape, dtype=bool)
+
+        if rows:
+            year_index = {year: i for i, year in enumerate(years)}
+            round_index = {round: i for i, round in enumerate(rounds)}
+            vote_type_index = {vote_type: i for i, vote_type in enumerate(vote_types)}
+            country_index = {country: i for i, country in enumerate(countries)}
+
+            index = tuple(np.array(column, dtype=np.intp) for column in zip(*(
+                (year_index[int(row['year'])], round_index[row['round']], vote_type_index[row['voteType']],
+                 country_index[row['votingCountry']], country_index[row['country']])
+                for row in rows
+            )))
+            points[index] = [int(row['points']) for row in rows]
+            voted[index] = True
+
+        return cls(points, voted, years, rounds, vote_types, countries)
+
+    @classmethod
+    def load_sidecar(cls, sidecar, stamp):
+        try:
+            with open(os.path.join(sidecar, 'axes.json'), encoding='utf-8') as f:
+                axes = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if axes.get('version') != SIDECAR_VERSION or axes.get('source') != stamp:
+            return None
+
+        return cls(
+            np.load(os.path.join(sidecar, 'points.npy'), mmap_mode='r'),
+            np.load(os.path.join(sidecar, 'voted.npy'), mmap_mode='r'),
+            axes['years'], axes['rounds'], axes['vote_types'], axes['countries']
+        )
+
+    def save_sidecar(self, sidecar, stamp):
+        os.makedirs(sidecar, exist_ok=True)
+
+        # the axes are written last, so a sidecar that was only partly written is never used
+        for name, array in (('points', self.points), ('voted', self.voted)):
+            tmp_path = os.path.join(sidecar, name + '.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(sidecar, name + '.npy'))
+
+        tmp_path = os.path.join(sidecar, 'axes.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': SIDECAR_VERSION,
+                'source': stamp,
+                'years': self.years,
+                'rounds': self.rounds,
+                'vote_types': self.vote_types,
+                'countries': self.countries,
+            }, f)
+        os.replace(tmp_path, os.path.join(sidecar, 'axes.json'))
+
+    @property
+    def awarded(self):
+        '''
+            points[year, round, voter, recipient] with the points that were awarded in total:
+            the 't' votes where a round has them, otherwise the sum of the jury and televotes
+        '''
+        if self._awarded is None:
+            total = self.vote_type_values('t')
+            split = self.vote_type_values('j', 'tv')
+
+            has_total = total.any(axis=(-2, -1)) if 't' in self.vote_type_index else np.zeros(self.points.shape[:2], dtype=bool)
+            self._awarded = np.where(has_total[..., None, None], total, split)
+
+        return self._awarded
+
+    def vote_type_values(self, *vote_types):
+        indexes = [self.vote_type_index[v] for v in vote_types if v in self.vote_type_index]
+        return self.points[:, :, indexes].sum(axis=2, dtype=np.int32)
+
+    def select(self, years=None, rounds=None, vote_types=None):
+        '''
+            Returns points[years, rounds, voter, recipient] for the provided years and rounds
+            (all of them by default), with the vote types summed up. vote_types=None counts
+            the points awarded in total (see awarded)
+        '''
+        year_indexes = self.indexes(self.year_index, years)
+        round_indexes = self.indexes(self.round_index, rounds)
+
+        if vote_types is None:
+            points = self.awarded
+        else:
+            points = self.vote_type_values(*([vote_types] if isinstance(vote_types, str) else vote_types))
+
+        return points[np.ix_(year_indexes, round_indexes)]
+
+    def totals(self, year, round='f', vote_types=None):
+        '''
+            Returns {country: points} of every country that received votes in a round, {} if
+            there's no such year or round in the data
+        '''
+        if year not in self.year_index or round not in self.round_index:
+            return {}
+
+        received = self.select([year], [round], vote_types)[0, 0].sum(axis=0)
+        participants = self.participants(year, round)
+
+        return {self.countries[i]: int(received[i]) for i in np.flatnonzero(participants)}
+
+    def ranking(self, year, round='f', vote_types=None):
+        '''
+            Returns the [(country, points)] of a round, highest score first. Ties are ordered
+            by the number of countries that gave any points, then by country code. [] if
+            there's no such year or round in the data
+        '''
+        if year not in self.year_index or round not in self.round_index:
+            return []
+
+        votes = self.select([year], [round], vote_types)[0, 0]
+        received = votes.sum(axis=0)
+        voters = (votes > 0).sum(axis=0)
+        participants = np.flatnonzero(self.participants(year, round))
+
+        order = np.lexsort((np.array(self.countries)[participants], -voters[participants], -received[participants]))
+        return [(self.countries[i], int(received[i])) for i in participants[order]]
+
+    def rankings(self, round='f', vote_types=None):
+        '''
+            Returns {year: [(country, points)]} of every year with the round, highest score first
+        '''
+        years = [year for year in self.years if self.participants(year, round).any()]
+        return {year: self.ranking(year, round, vote_types) for year in years}
+
+    def participants(self, year, round='f'):
+        '''
+            A boolean array of the countries that received votes in a round (of any type)
+        '''
+        if year not in self.year_index or round not in self.round_index:
+            return np.zeros(len(self.countries), dtype=bool)
+
+        return self.voted[self.year_index[year], self.round_index[round]].any(axis=(0, 1))
+
+    def head_to_head(self, voter, recipient, years=None, rounds=None, vote_types=None):
+        '''
+            Returns {year: points} that the voting country gave to the recipient, for every
+            year in which it voted for the recipient
+        '''
+        voter_index, recipient_index = self.country_index[voter], self.country_index[recipient]
+        year_indexes = self.indexes(self.year_index, years)
+
+        points = self.select(years, rounds, vote_types)[:, :, voter_index, recipient_index].sum(axis=1)
+        voted = self.voted[np.ix_(year_indexes, self.indexes(self.round_index, rounds))][..., voter_index, recipient_index]
+
+        return {self.years[year_indexes[i]]: int(points[i]) for i in np.flatnonzero(voted.any(axis=(1, 2)))}
+
+    def bloc_matrix(self, years=None, rounds=None, vote_types=None, average=False):
+        '''
+            Returns (matrix, countries): matrix[voter, recipient] holds the points that each
+            country gave to each other country over the provided years and rounds. With
+            average=True it holds the average points per vote instead (0 where a country never
+            voted for the other)
+        '''
+        matrix = self.select(years, rounds, vote_types).sum(axis=(0, 1))
+
+        if average:
+            year_indexes = self.indexes(self.year_index, years)
+            round_indexes = self.indexes(self.round_index, rounds)
+            # a jury and a televote in the same round count as a single vote
+            votes = self.voted[np.ix_(year_indexes, round_indexes)].any(axis=2).sum(axis=(0, 1))
+            matrix = np.divide(matrix, votes, out=np.zeros(matrix.shape), where=votes > 0)
+
+        return matrix, self.countries
+
+    @staticmethod
+    def indexes(index, values):
+        if values is None:
+            return np.arange(len(index))
+
+        if isinstance(values, (str, int)):
+            values = [values]
+
+        return np.array([index[value] for value in values if value in index], dtype=np.intp)
+
+
+def axis_values(known, values):
+    '''
+        The known values that occur in the data, in order, followed by any other values
+    '''
+    values = set(values)
+    return [value for value in known if value in values] + sorted(values.difference(known))
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,97 @@
+'''
+    Watch mode: the article of a single contest year is polled with conditional requests, and
+    the rows that were added, changed or removed since the last poll are written out straight
+    away as JSON lines, e.g. while the scoreboard of the current contest is being filled in.
+
+    e.g.
+        scrapy crawl eurovision_vote -a watch=2025
+        scrapy crawl eurovision_results -a watch=2025 -s WATCH_INTERVAL=2 -s WATCH_OUTPUT=results.jl
+
+    Each line is a row with the change and the table it's in, e.g.
+        {"change": "added", "table": "f/j", "year": 2025, "round": "f", "country": "se", ...}
+
+    Only the tables whose html changed since the last poll are parsed again (see TableWatch).
+    The first poll writes every row as added.
+'''
+import hashlib
+import json
+import sys
+
+from itemadapter import ItemAdapter
+
+from eurovision_scraper.pipelines import normalise_countries, row_key
+
+
+def table_digest(table):
+    '''
+        The hash of the html of a table (a Selector or SelectorList), '' if there's no table
+    '''
+    html = table.get() if table is not None else None
+
+    if not html:
+        return ''
+
+    return hashlib.blake2b(html.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class TableWatch:
+    '''
+        The content hash and the rows of each table of the watched article, as of the last poll
+    '''
+
+    def __init__(self):
+        self.tables = {}
+
+    def changed(self, name, digest):
+        return name not in self.tables or self.tables[name][0] != digest
+
+    def update(self, name, digest, items):
+        '''
+            Replace the rows of a table, returns the changes as (change, row) pairs with change
+            one of 'added', 'changed' or 'removed'
+        '''
+        previous = self.tables.get(name, (None, {}))[1]
+        rows = {}
+
+        for item in items:
+            # the rows don't go through the item pipelines, their countries are normalised here
+            item, _ = normalise_countries(item)
+            adapter = ItemAdapter(item)
+            row = adapter.asdict()
+            # rows are told apart by their dedup key, e.g. the year, round, countries and vote
+            # type of a vote, so that a corrected score shows up as a change of that row
+            key = row_key(adapter)
+            rows[key if key is not None else tuple(row.items())] = row
+
+        self.tables[name] = (digest, rows)
+
+        changes = []
+        for key, row in rows.items():
+            if key not in previous:
+                changes.append(('added', row))
+            elif previous[key] != row:
+                changes.append(('changed', row))
+
+        changes.extend(('removed', row) for key, row in previous.items() if key not in rows)
+        return changes
+
+
+class DeltaWriter:
+    '''
+        Writes the changes as JSON lines to a file ('-' for stdout), each line flushed as it's
+        written
+    '''
+
+    def __init__(self, path='-'):
+        self.path = path
+        self.file = sys.stdout if path == '-' else open(path, 'a', encoding='utf-8')
+
+    def write(self, table, changes):
+        for change, row in changes:
+            self.file.write(json.dumps({'change': change, 'table': table, **row}, ensure_ascii=False) + '\n')
+
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
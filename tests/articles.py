@@ -0,0 +1,44 @@
+'''
+    Synthetic contest articles for the mock wiki
+'''
+import os
+
+
+def results_article(year, places):
+    '''
+        The html of a contest article with just a results table, places being
+        [(country, place)] in running order
+    '''
+    rows = ''.join(
+        f'<tr><th>{running_order}</th><td><a title="{country}">{country}</a></td><td>{place}</td></tr>'
+        for running_order, (country, place) in enumerate(places, start=1)
+    )
+
+    return (
+        f'<html><body><h2>Final</h2><table class="wikitable">'
+        f'<caption>Results of the Eurovision Song Contest {year}</caption>'
+        f'<tr><th>R/O</th><th>Country</th><th>Place</th></tr>{rows}</table></body></html>'
+    )
+
+
+def write_pages(pages_dir, articles):
+    '''
+        Write {year: html} into a directory of pages for the mock server
+    '''
+    os.makedirs(pages_dir, exist_ok=True)
+
+    for year, html in articles.items():
+        with open(os.path.join(pages_dir, f'Eurovision_Song_Contest_{year}.html'), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+
+# three small contests, 1956 to 1958
+ARTICLES = {
+    1956: results_article(1956, [('Switzerland', '1'), ('Netherlands', '2')]),
+    1957: results_article(1957, [('Belgium', '2'), ('Netherlands', '1'), ('Italy', '3')]),
+    1958: results_article(1958, [('France', '2'), ('Sweden', '3'), ('Switzerland', '1')]),
+}
+
+
+def rows_by_key(rows):
+    return {(row['year'], row['country']): row for row in rows}
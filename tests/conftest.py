@@ -0,0 +1,133 @@
+'''
+    Fixtures that run the spiders against the mock wiki (see eurovision_scraper/mockserver.py),
+    each in its own process and in a temporary project directory, so that the snapshot store,
+    the incremental state and the feeds of a test don't leak into other tests
+'''
+import csv
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the settings of every test crawl, unless a test sets them itself
+CRAWL_SETTINGS = {
+    'SNAPSHOT_ENABLED': False,
+    'THROTTLE_ENABLED': False,
+    'LOG_LEVEL': 'INFO',
+}
+
+STAT_RE = re.compile(r"'([\w/.]+)': (\d+(?:\.\d+)?)[,}]")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class MockServer:
+    '''
+        The mock wiki running in a process of its own. The counts it prints on exit (requests,
+        served, not_modified, throttled, ...) are read into counts by stop()
+    '''
+
+    def __init__(self, *args):
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}/wiki/'
+        self.counts = {}
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'eurovision_scraper.mockserver', '--port', str(self.port), *args],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'The mock server did not start: {self.process.stdout.read()}')
+                time.sleep(0.05)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+        output = self.process.communicate(timeout=10)[0]
+        last_line = output.strip().splitlines()[-1] if output.strip() else ''
+        self.counts = {name: int(count) for name, count in re.findall(r'(\w+): (\d+)', last_line)}
+        return self.counts
+
+
+class Crawl:
+    '''
+        The rows written by a finished crawl and its stats
+    '''
+
+    def __init__(self, rows, stats, log):
+        self.rows = rows
+        self.stats = stats
+        self.log = log
+
+
+@pytest.fixture
+def project(tmp_path):
+    '''
+        A project directory of its own for the crawls of a test
+    '''
+    shutil.copy(os.path.join(ROOT, 'scrapy.cfg'), tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(*args):
+        server = MockServer(*args)
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def crawl(project):
+    '''
+        Runs a spider in the project directory, e.g. crawl('eurovision_results', '--incremental',
+        years='1957', WIKI_BASE_URL=server.base_url), and returns the Crawl
+    '''
+    def run(spider, *options, years=None, **settings):
+        output = project / 'output.csv'
+        if output.exists():
+            output.unlink()
+
+        command = [sys.executable, '-m', 'scrapy', 'crawl', spider, '-O', str(output), *options]
+        if years:
+            command += ['-a', f'years={years}']
+        for name, value in {**CRAWL_SETTINGS, **settings}.items():
+            command += ['-s', f'{name}={value}']
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        process = subprocess.run(command, cwd=project, env=env, capture_output=True, text=True, timeout=300)
+        assert process.returncode == 0, process.stderr
+
+        with open(output, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+        stats = {name: float(value) for name, value in STAT_RE.findall(process.stderr)}
+        return Crawl(rows, stats, process.stderr)
+
+    return run
@@ -0,0 +1,93 @@
+'''
+    The enrichment spider against the query api of the mock wiki (--wikitext)
+'''
+import csv
+from urllib.parse import quote
+
+WIKITEXT = {
+    'ABBA': (
+        '{{Infobox musical artist\n| name = ABBA\n| origin = [[Stockholm]], Sweden\n'
+        '| genre = {{hlist|[[Pop music|Pop]]|Europop}}\n}}\n'
+        "'''ABBA''' were a Swedish group.\n== History ==\n{{Infobox other|genre=Not this one}}\n"
+    ),
+    'Waterloo (ABBA song)': '{{Infobox song\n| name = Waterloo\n| length = 2:42\n}}\n',
+    'Lys Assia': (
+        '{{Infobox person\n| birth_date = {{birth date|1924|3|3}}\n'
+        '| birth_place = [[Rupperswil]], Switzerland\n}}\n'
+    ),
+    'Refrain (song)': '#REDIRECT [[Refrain (Lys Assia song)]]',
+    'Refrain (Lys Assia song)': '{{Infobox song\n| length = {{duration|m=3|s=5}}\n}}\n',
+}
+
+PARTICIPANTS = [
+    ('1956', 'ch', 'Lys_Assia', 'Refrain_(song)'),
+    ('1974', 'se', 'ABBA', 'Waterloo_(ABBA_song)'),
+    # a second link to the same page and a page that doesn't exist
+    ('1975', 'se', 'ABBA', 'Unknown_song'),
+]
+
+
+def write_fixtures(project, base_url):
+    wikitext = project / 'wikitext'
+    wikitext.mkdir()
+    for title, text in WIKITEXT.items():
+        (wikitext / (quote(title.replace(' ', '_'), safe='') + '.wiki')).write_text(text, encoding='utf-8')
+
+    with open(project / 'participants.csv', 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['year', 'country', 'artistWikiUrl', 'songWikiUrl'])
+        for year, country, artist, song in PARTICIPANTS:
+            writer.writerow([year, country, base_url + artist, base_url + song])
+
+    return wikitext
+
+
+def test_enrichment_looks_up_each_page_once_in_batches(project, mock_server, crawl):
+    wikitext = write_fixtures(project, 'https://en.wikipedia.org/wiki/')
+    server = mock_server('--wikitext', str(wikitext))
+    api_url = server.base_url.replace('/wiki/', '/w/api.php')
+
+    # robots.txt is obeyed, as in any crawl: it disallows /w/, the queries go through all the same
+    enriched = crawl(
+        'eurovision_enrichment', '-a', f"participants={project / 'participants.csv'}",
+        WIKI_API_URL=api_url, ENRICHMENT_BATCH_SIZE=2, ROBOTSTXT_OBEY=True
+    )
+    rows = {row['url'].rsplit('/', 1)[-1]: row for row in enriched.rows}
+
+    assert sorted(rows) == ['ABBA', 'Lys_Assia', 'Refrain_(song)', 'Unknown_song', 'Waterloo_(ABBA_song)']
+    assert rows['ABBA']['kind'] == 'artist'
+    assert rows['ABBA']['origin'] == 'Stockholm, Sweden'
+    assert rows['ABBA']['genre'] == 'Pop|Europop'
+    assert rows['Lys_Assia']['birthYear'] == '1924'
+    assert rows['Waterloo_(ABBA_song)']['length'] == '2:42'
+    # followed through the redirect
+    assert rows['Refrain_(song)']['title'] == 'Refrain (Lys Assia song)'
+    assert rows['Refrain_(song)']['length'] == '3:05'
+    assert rows['Unknown_song']['pageId'] == ''
+    assert 'robotstxt/forbidden' not in enriched.stats
+
+    # five pages, two titles per query
+    assert enriched.stats['enrichment/fetched'] == 4
+    assert enriched.stats['enrichment/missing'] == 1
+    assert server.stop()['queries'] == 3
+
+
+def test_enrichment_follows_the_continue_token_and_reuses_the_cache(project, mock_server, crawl):
+    wikitext = write_fixtures(project, 'https://en.wikipedia.org/wiki/')
+    server = mock_server('--wikitext', str(wikitext), '--max-query-bytes', '60')
+    api_url = server.base_url.replace('/wiki/', '/w/api.php')
+    options = ('-a', f"participants={project / 'participants.csv'}")
+
+    # the responses are cut short after 60 bytes of wikitext, each batch is continued until
+    # every page is answered
+    first = crawl('eurovision_enrichment', *options, WIKI_API_URL=api_url)
+    assert len(first.rows) == 5
+    assert first.stats['enrichment/continued'] >= 1
+    assert first.stats['enrichment/fetched'] == 4
+
+    # the pages are all in the cache now
+    second = crawl('eurovision_enrichment', *options, WIKI_API_URL=api_url)
+    assert second.stats['enrichment/cached'] == 5
+    assert sorted(second.rows, key=lambda row: row['url']) == sorted(first.rows, key=lambda row: row['url'])
+
+    assert server.stop()['queries'] == 1 + first.stats['enrichment/continued']
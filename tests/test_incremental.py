@@ -0,0 +1,31 @@
+'''
+    Incremental crawls against the mock wiki: conditional requests and the reuse of the rows of
+    unchanged articles
+'''
+from articles import ARTICLES, results_article, rows_by_key, write_pages
+
+
+def test_incremental_crawl_reuses_the_rows_of_unchanged_articles(project, mock_server, crawl):
+    pages = project / 'pages'
+    write_pages(pages, ARTICLES)
+    server = mock_server('--pages', str(pages))
+
+    first = crawl('eurovision_results', '--incremental', years='1956-1958', WIKI_BASE_URL=server.base_url)
+    assert len(first.rows) == 8
+    assert first.stats['incremental/parsed'] == 3
+
+    # every article is answered with a 304 and the previous rows are written again
+    second = crawl('eurovision_results', '--incremental', years='1956-1958', WIKI_BASE_URL=server.base_url)
+    assert second.stats['incremental/unchanged'] == 3
+    assert 'incremental/parsed' not in second.stats
+    assert rows_by_key(second.rows) == rows_by_key(first.rows)
+
+    # only the edited article is parsed again
+    write_pages(pages, {1958: results_article(1958, [('France', '1'), ('Sweden', '3'), ('Switzerland', '2')])})
+    third = crawl('eurovision_results', '--incremental', years='1956-1958', WIKI_BASE_URL=server.base_url)
+    assert third.stats['incremental/unchanged'] == 2
+    assert third.stats['incremental/parsed'] == 1
+    assert rows_by_key(third.rows)[('1958', 'fr')]['place'] == '1'
+    assert rows_by_key(third.rows)[('1957', 'nl')] == rows_by_key(first.rows)[('1957', 'nl')]
+
+    assert server.stop()['not_modified'] == 5
@@ -0,0 +1,39 @@
+'''
+    Merging the shards of a crawl into a single file
+'''
+import os
+import shutil
+import subprocess
+import sys
+
+from articles import ARTICLES, write_pages
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_merged_shards_are_the_single_crawl(project, mock_server, crawl):
+    pages = project / 'pages'
+    write_pages(pages, ARTICLES)
+    server = mock_server('--pages', str(pages))
+
+    crawl('eurovision_results', years='1956-1958', WIKI_BASE_URL=server.base_url)
+    shutil.copy(project / 'output.csv', project / 'single.csv')
+
+    # the shards overlap in 1957, its rows are written once
+    for i, years in enumerate(['1957-1958', '1956-1957'], start=1):
+        crawl('eurovision_results', years=years, WIKI_BASE_URL=server.base_url)
+        shutil.copy(project / 'output.csv', project / f'shard_{i}.csv')
+
+    subprocess.run(
+        [sys.executable, '-m', 'eurovision_scraper.merge', '-o', str(project / 'merged.csv'),
+         str(project / 'shard_1.csv'), str(project / 'shard_2.csv')],
+        cwd=ROOT, check=True, capture_output=True
+    )
+
+    # the same header and rows, byte for byte, sorted in the merged file
+    single = (project / 'single.csv').read_bytes().splitlines(keepends=True)
+    merged = (project / 'merged.csv').read_bytes().splitlines(keepends=True)
+    assert len(merged) == 9
+    assert merged[0] == single[0]
+    assert sorted(merged[1:]) == sorted(single[1:])
+    assert all(line.endswith(b'\r\n') for line in merged)
@@ -0,0 +1,30 @@
+'''
+    The sections fetch mode against the parse api of the mock wiki
+'''
+from articles import ARTICLES, rows_by_key, write_pages
+
+
+def test_sections_mode_fetches_the_tables_through_the_parse_api(project, mock_server, crawl):
+    pages = project / 'pages'
+    write_pages(pages, ARTICLES)
+    server = mock_server('--pages', str(pages))
+    api_url = server.base_url.replace('/wiki/', '/w/api.php')
+
+    articles = crawl('eurovision_results', years='1956-1958', WIKI_BASE_URL=server.base_url)
+
+    # robots.txt is obeyed, as in any crawl: it disallows /w/, the api requests go through
+    # all the same
+    sections = crawl(
+        'eurovision_results', '-a', 'fetch_mode=sections', years='1956-1958',
+        WIKI_BASE_URL=server.base_url, WIKI_API_URL=api_url, ROBOTSTXT_OBEY=True
+    )
+    counts = server.stop()
+
+    assert rows_by_key(sections.rows) == rows_by_key(articles.rows)
+    assert len(sections.rows) == 8
+    assert 'robotstxt/forbidden' not in sections.stats
+
+    # the articles of the first crawl and, for each of the three articles, its table of
+    # contents and its one section with a table
+    assert counts['served'] == 3
+    assert counts['api'] == 6
@@ -0,0 +1,21 @@
+'''
+    Replaying a crawl from the snapshot store, without the mock wiki
+'''
+from articles import ARTICLES, rows_by_key, write_pages
+
+
+def test_replay_crawls_the_snapshot_store_without_the_server(project, mock_server, crawl):
+    pages = project / 'pages'
+    write_pages(pages, ARTICLES)
+    server = mock_server('--pages', str(pages))
+
+    # robots.txt is stored along with the three articles (it's never fetched while replaying)
+    recorded = crawl('eurovision_results', years='1956-1958', WIKI_BASE_URL=server.base_url, SNAPSHOT_ENABLED=True)
+    assert recorded.stats['snapshot/stored'] == 4
+    assert server.stop()['served'] == 3
+
+    # the server is gone, every article comes from the snapshot store
+    replayed = crawl('eurovision_results', '--replay', years='1956-1958', WIKI_BASE_URL=server.base_url, SNAPSHOT_ENABLED=True)
+    assert replayed.stats['snapshot/replayed'] == 3
+    assert 'downloader/exception_count' not in replayed.stats
+    assert rows_by_key(replayed.rows) == rows_by_key(recorded.rows)
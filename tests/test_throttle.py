@@ -0,0 +1,29 @@
+'''
+    The adaptive throttle against a mock wiki that throttles its clients
+'''
+from articles import ARTICLES, write_pages
+
+
+def test_throttled_requests_are_retried_after_retry_after(project, mock_server, crawl):
+    pages = project / 'pages'
+    write_pages(pages, ARTICLES)
+    server = mock_server('--pages', str(pages), '--throttle-every', '2', '--retry-after', '1')
+
+    throttled = crawl(
+        'eurovision_results', years='1956-1958', WIKI_BASE_URL=server.base_url,
+        THROTTLE_ENABLED=True, THROTTLE_START_RATE=50, THROTTLE_MAX_RATE=50, THROTTLE_BURST=5,
+        CONCURRENT_REQUESTS=1
+    )
+    counts = server.stop()
+
+    # every article is scraped in the end, each throttled request retried once
+    assert len(throttled.rows) == 8
+    assert counts['throttled'] >= 1
+    assert throttled.stats['throttle/response_status_count/429'] == counts['throttled']
+    assert throttled.stats['throttle/retried'] == counts['throttled']
+    assert 'throttle/gave_up' not in throttled.stats
+
+    # the host was paused for the Retry-After of each throttling response, rather than being
+    # asked again at the rate of 50 requests per second
+    assert throttled.stats['throttle/delay_time'] >= 0.9 * counts['throttled']
+    assert throttled.stats['elapsed_time_seconds'] >= counts['throttled']
@@ -0,0 +1,37 @@
+'''
+    Watch mode against a mock wiki that serves a new revision of the article on every poll
+'''
+import json
+
+from articles import results_article, write_pages
+
+
+def test_watch_writes_the_rows_that_changed_between_polls(project, mock_server, crawl):
+    write_pages(project / 'r0', {1958: results_article(1958, [('France', '2'), ('Sweden', '3'), ('Switzerland', '1')])})
+    write_pages(project / 'r1', {1958: results_article(1958, [('France', '1'), ('Sweden', '3'), ('Switzerland', '2')])})
+    # rows are told apart by year, country and running order, Switzerland is the last to run
+    write_pages(project / 'r2', {1958: results_article(1958, [('France', '1'), ('Sweden', '3')])})
+    server = mock_server('--revisions', f"{project / 'r0'},{project / 'r1'},{project / 'r2'}")
+
+    watched = crawl(
+        'eurovision_results', '-a', 'watch=1958', WIKI_BASE_URL=server.base_url,
+        WATCH_INTERVAL=0.5, WATCH_OUTPUT=project / 'changes.jl', CLOSESPIDER_TIMEOUT=4
+    )
+    counts = server.stop()
+
+    with open(project / 'changes.jl', encoding='utf-8') as f:
+        changes = [json.loads(line) for line in f]
+
+    summary = [(change['change'], change['country'], change['place']) for change in changes]
+    assert summary == [
+        ('added', 'fr', '2'), ('added', 'se', '3'), ('added', 'ch', '1'),
+        ('changed', 'fr', '1'), ('changed', 'ch', '2'),
+        ('removed', 'ch', '2'),
+    ]
+    assert all(change['table'] == 'results' and change['year'] == 1958 for change in changes)
+
+    # the article stays at its last revision, later polls are answered with a 304
+    assert counts['not_modified'] >= 1
+    assert watched.stats['watch/not_modified'] == counts['not_modified']
+    assert watched.stats['watch/changes'] == 6
+    assert watched.rows == []